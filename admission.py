@@ -0,0 +1,256 @@
+import asyncio
+import heapq
+import itertools
+import math
+import threading
+import time
+from collections import OrderedDict
+
+# Lower value is served first
+PRIORITIES = {'interactive': 0, 'batch': 1, 'precompute': 2}
+
+
+class Rejected(Exception):
+    """Request refused at admission; retry_after is in seconds"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBuckets:
+    """Per-key token buckets, e.g. one per employee_number.
+
+    Holds at most `max_keys` buckets; the least recently used are dropped,
+    which only ever hands a client a fresh (full) bucket.
+    """
+
+    def __init__(self, rate=1.0, burst=10, max_keys=10000, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._clock = clock
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    def consume(self, key, cost=1):
+        """Take `cost` tokens or raise Rejected with the wait until they are available"""
+        cost = min(cost, self.burst)
+        with self._lock:
+            now = self._clock()
+            tokens, updated = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens < cost:
+                self._buckets[key] = (tokens, now)
+                self.rejected += 1
+                raise Rejected("Rate limit exceeded", math.ceil((cost - tokens) / self.rate))
+            self._buckets[key] = (tokens - cost, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+
+
+class ClientRateLimits:
+    """A bucket per client address and, when one is given, per employee; a request must pass both.
+
+    The employee number is whatever the client sends, so the address bucket
+    is what stops a client that rotates them.
+    """
+
+    def __init__(self, ip_buckets, employee_buckets):
+        self.ip_buckets = ip_buckets
+        self.employee_buckets = employee_buckets
+
+    def consume(self, address, employee_number=None, cost=1):
+        self.ip_buckets.consume(address, cost)
+        if employee_number:
+            self.employee_buckets.consume(str(employee_number), cost)
+
+    @property
+    def rejected(self):
+        return self.ip_buckets.rejected + self.employee_buckets.rejected
+
+
+def client_address(remote_addr, forwarded_for, proxy_hops=0):
+    """The caller's address, taken from X-Forwarded-For when `proxy_hops` trusted proxies (e.g. an ALB) sit in front.
+
+    Each proxy appends the address it received from, so the entry `proxy_hops`
+    from the right is the last one a trusted proxy wrote; anything left of it
+    is client-supplied. As werkzeug's ProxyFix.
+    """
+    if proxy_hops and forwarded_for:
+        addresses = [address.strip() for address in forwarded_for.split(',')]
+        if len(addresses) >= proxy_hops:
+            return addresses[-proxy_hops]
+    return remote_addr
+
+
+class _Ticket:
+    __slots__ = ('granted', 'cancelled', 'evicted')
+
+    def __init__(self):
+        self.granted = threading.Event()
+        self.cancelled = False
+        self.evicted = False
+
+
+class AdmissionController:
+    """Bounded, priority-ordered admission to a fixed number of request slots.
+
+    Up to `max_active` requests run at once. Others wait in a queue of at
+    most `max_queue` entries, ordered by priority and then arrival time. A
+    request that finds the queue full is rejected at once instead of
+    waiting, unless a lower-priority request is queued: then the newest of
+    the lowest-priority waiters is rejected to make room, so a queue full of
+    batch work never turns interactive requests away.
+    """
+
+    def __init__(self, max_active=32, max_queue=64, queue_timeout=15.0, retry_after=1):
+        self.max_active = max_active
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self._active = 0
+        self._queue = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self.admitted = 0
+        self.rejected = 0
+        self.preempted = 0
+        self.timed_out = 0
+
+    def acquire(self, priority):
+        with self._lock:
+            # Slots are handed to live waiters before being freed, so a free slot means nobody is waiting
+            if self._active < self.max_active:
+                self._queue.clear()
+                self._active += 1
+                self.admitted += 1
+                return
+            if len(self._queue) >= self.max_queue:
+                self._queue = [entry for entry in self._queue if not entry[2].cancelled]
+                heapq.heapify(self._queue)
+            if len(self._queue) >= self.max_queue:
+                victim = max(self._queue)
+                if victim[0] <= priority:
+                    self.rejected += 1
+                    raise Rejected("Server busy", self.retry_after)
+                self._queue.remove(victim)
+                heapq.heapify(self._queue)
+                victim[2].evicted = True
+                victim[2].granted.set()
+                self.preempted += 1
+            ticket = _Ticket()
+            heapq.heappush(self._queue, (priority, next(self._seq), ticket))
+
+        # The slot may have been handed over between a timeout and taking the lock
+        if not ticket.granted.wait(self.queue_timeout):
+            with self._lock:
+                if not ticket.granted.is_set():
+                    ticket.cancelled = True
+                    self.timed_out += 1
+                    raise Rejected("Timed out waiting in queue", self.retry_after)
+        if ticket.evicted:
+            raise Rejected("Server busy", self.retry_after)
+
+    def release(self):
+        with self._lock:
+            while self._queue:
+                _, _, ticket = heapq.heappop(self._queue)
+                if not ticket.cancelled:
+                    # Hand the slot straight to the next waiter; _active stays the same
+                    self.admitted += 1
+                    ticket.granted.set()
+                    return
+            self._active -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'active': self._active,
+                'queued': sum(1 for _, _, ticket in self._queue if not ticket.cancelled),
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+                'preempted': self.preempted,
+                'timed_out': self.timed_out,
+            }
+
+
+class AsyncAdmissionController:
+    """AdmissionController for coroutines on one event loop.
+
+    Queued requests wait on a future instead of a thread, so `max_active`
+    and `max_queue` can be far larger than a thread pool allows; the
+    Bedrock limiter still bounds how many reach Bedrock at once.
+    """
+
+    def __init__(self, max_active=1024, max_queue=4096, queue_timeout=15.0, retry_after=1):
+        self.max_active = max_active
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self._active = 0
+        self._queue = []
+        self._seq = itertools.count()
+        self.admitted = 0
+        self.rejected = 0
+        self.preempted = 0
+        self.timed_out = 0
+
+    async def acquire(self, priority):
+        if self._active < self.max_active:
+            self._queue.clear()
+            self._active += 1
+            self.admitted += 1
+            return
+        if len(self._queue) >= self.max_queue:
+            self._queue = [entry for entry in self._queue if not entry[2].done()]
+            heapq.heapify(self._queue)
+        if len(self._queue) >= self.max_queue:
+            # As AdmissionController: make room by turning away the newest lowest-priority waiter
+            victim = max(self._queue)
+            if victim[0] <= priority:
+                self.rejected += 1
+                raise Rejected("Server busy", self.retry_after)
+            self._queue.remove(victim)
+            heapq.heapify(self._queue)
+            victim[2].set_exception(Rejected("Server busy", self.retry_after))
+            self.preempted += 1
+        ticket = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._seq), ticket))
+
+        try:
+            await asyncio.wait_for(asyncio.shield(ticket), self.queue_timeout)
+        except asyncio.TimeoutError:
+            # A slot handed over (or an eviction) as the timeout fired still counts
+            if ticket.done():
+                return ticket.result()
+            ticket.cancel()
+            self.timed_out += 1
+            raise Rejected("Timed out waiting in queue", self.retry_after) from None
+        except asyncio.CancelledError:
+            # The client went away; give back a slot that was already handed to us
+            if ticket.done() and not ticket.cancelled() and ticket.exception() is None:
+                self.release()
+            else:
+                ticket.cancel()
+            raise
+
+    def release(self):
+        while self._queue:
+            _, _, ticket = heapq.heappop(self._queue)
+            if not ticket.done():
+                self.admitted += 1
+                ticket.set_result(None)
+                return
+        self._active -= 1
+
+    def stats(self):
+        return {
+            'active': self._active,
+            'queued': sum(1 for _, _, ticket in self._queue if not ticket.done()),
+            'admitted': self.admitted,
+            'rejected': self.rejected,
+            'preempted': self.preempted,
+            'timed_out': self.timed_out,
+        }
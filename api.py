@@ -1,20 +1,147 @@
-from flask import Flask, request, jsonify
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+from flask import Flask, request, jsonify, Response, make_response, stream_with_context
 from flask_cors import CORS
-from bedrock_client import get_financial_advice
+from admission import AdmissionController, Rejected
+from api_policy import (ADMISSION_QUEUE_TIMEOUT, BATCH_MAX_CONCURRENCY, EXPOSE_HEADERS, INVALID_QUESTION,
+                        MAX_BODY_BYTES, SSE_HEADERS, InvalidRequest, add_admission_gauges, admission_priority,
+                        advice_params, api_stats, batch_cost, batch_params, check_rate_limit, error_body,
+                        rejection, sse_event, valid_question)
+import api_policy
+from bedrock_client import get_financial_advice, stream_financial_advice, warm_up_bedrock, shutdown_executors
+from knowledge_base import get_knowledge_base
+import metrics
+from request_profiling import profiled
 
 app = Flask(__name__)
-CORS(app)
+app.config['MAX_CONTENT_LENGTH'] = MAX_BODY_BYTES
+CORS(app, expose_headers=EXPOSE_HEADERS)
+
+batch_executor = ThreadPoolExecutor(max_workers=BATCH_MAX_CONCURRENCY, thread_name_prefix='advice-batch')
+admission = AdmissionController(
+    max_active=int(os.environ.get('ADMISSION_MAX_ACTIVE', '32')),
+    max_queue=int(os.environ.get('ADMISSION_MAX_QUEUE', '64')),
+    queue_timeout=ADMISSION_QUEUE_TIMEOUT,
+)
+add_admission_gauges(admission)
+
+@app.errorhandler(InvalidRequest)
+def invalid_request(e):
+    return jsonify(error_body(str(e))), e.status
+
+def request_data():
+    return api_policy.request_data(request.method, request.get_json(silent=True), request.args)
+
+def admitted(default_priority='interactive', cost=lambda data: 1):
+    """Rate-limit the request, then wait for an admission slot in priority order.
+
+    The slot is held until the response is fully sent, which for SSE means
+    the end of the stream.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            data = request_data()
+            try:
+                check_rate_limit(request.remote_addr, request.headers, data, cost(data))
+                admission.acquire(admission_priority(default_priority, request.headers))
+            except Rejected as e:
+                body, status, headers = rejection(e)
+                return jsonify(body), status, headers
+
+            try:
+                response = make_response(view(*args, **kwargs))
+            except Exception:
+                admission.release()
+                raise
+            response.call_on_close(admission.release)
+            return response
+        return wrapper
+    return decorator
 
 @app.route('/api/advice', methods=['POST'])
+@profiled
+@admitted()
 def get_advice():
-    data = request.json
-    question = data.get('question', '')
-    
+    question, use_cache, request_class = advice_params(request.method, request_data())
     try:
-        answer = get_financial_advice(question)
+        answer = get_financial_advice(question, use_cache=use_cache, request_class=request_class)
         return jsonify({'success': True, 'answer': answer})
     except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
+        return jsonify(error_body(str(e))), 500
+
+@app.route('/api/advice/batch', methods=['POST'])
+@profiled
+@admitted('batch', cost=batch_cost)
+def get_advice_batch():
+    questions, use_cache, request_class = batch_params(request_data())
+    futures = []
+    for question in questions:
+        if valid_question(question):
+            # fallback=False: a failed item is reported as one rather than as the demo text
+            futures.append(batch_executor.submit(get_financial_advice, question, use_cache, request_class,
+                                                 fallback=False))
+        else:
+            futures.append(None)
+
+    results = []
+    for future in futures:
+        if future is None:
+            results.append(error_body(INVALID_QUESTION))
+            continue
+        try:
+            results.append({'success': True, 'answer': future.result()})
+        except Exception as e:
+            results.append(error_body(str(e)))
+    return jsonify({'success': True, 'results': results})
+
+@app.route('/api/advice/stats', methods=['GET'])
+def get_advice_stats():
+    return jsonify(api_stats(admission))
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    # Prometheus text exposition format; not admitted so scrapes work under load
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/advice/stream', methods=['GET', 'POST'])
+@profiled
+@admitted()
+def stream_advice():
+    # GET is for EventSource clients, POST mirrors /api/advice
+    question, use_cache, request_class = advice_params(request.method, request_data())
+
+    def generate():
+        try:
+            for text in stream_financial_advice(question, use_cache=use_cache, request_class=request_class):
+                yield sse_event({'text': text})
+            yield sse_event({'success': True}, event='done')
+        except Exception as e:
+            yield sse_event(error_body(str(e)), event='error')
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers=SSE_HEADERS)
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    return jsonify({'status': 'ok', 'pid': os.getpid()})
+
+def prepare_for_fork():
+    """Build shared state in the serving master so forked workers inherit it.
+
+    Only builds the client: no connection is opened, since sockets must not
+    be shared between workers.
+    """
+    warm_up_bedrock()
+    # The index is memory-mapped, so workers share its pages
+    get_knowledge_base()
+
+def drain():
+    """Let queued batch and hedge work finish before a worker exits"""
+    batch_executor.shutdown(wait=True)
+    shutdown_executors()
 
 if __name__ == '__main__':
-    app.run(debug=True, port=5000)
\ No newline at end of file
+    # Development server only; serve production traffic with: gunicorn -c gunicorn.conf.py api:app
+    warm_up_bedrock()
+    app.run(debug=True, port=5000)
@@ -0,0 +1,138 @@
+"""Request policy shared by api.py (Flask) and asgi_api.py (Quart).
+
+Settings, validation, rate limits and admission priorities live here so both
+servers answer a request the same way. Each server keeps only its own
+admission controller and batch concurrency, sized for threads or coroutines.
+"""
+import json
+import os
+
+import metrics
+from admission import PRIORITIES, ClientRateLimits, TokenBuckets, client_address
+from bedrock_client import advice_stats
+from model_routing import DEFAULT_REQUEST_CLASS, ROUTES
+
+# Shared by every batch request so total fan-out stays within the Bedrock quota
+BATCH_MAX_CONCURRENCY = int(os.environ.get('ADVICE_BATCH_MAX_CONCURRENCY', '8'))
+BATCH_MAX_QUESTIONS = int(os.environ.get('ADVICE_BATCH_MAX_QUESTIONS', '50'))
+MAX_BODY_BYTES = int(os.environ.get('API_MAX_BODY_BYTES', str(1024 * 1024)))
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get('ADMISSION_QUEUE_TIMEOUT', '15'))
+
+# Retry-After must be exposed for browsers on other origins to read it from a 429
+EXPOSE_HEADERS = ['Retry-After']
+SSE_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+# Proxies in front of the app whose X-Forwarded-For is trusted (1 behind the ALB)
+PROXY_HOPS = int(os.environ.get('API_PROXY_HOPS', '0'))
+rate_limits = ClientRateLimits(
+    ip_buckets=TokenBuckets(
+        rate=float(os.environ.get('ADVICE_IP_RATE_PER_SECOND', '2')),
+        burst=int(os.environ.get('ADVICE_IP_RATE_BURST', '40')),
+    ),
+    employee_buckets=TokenBuckets(
+        rate=float(os.environ.get('ADVICE_RATE_PER_SECOND', '0.5')),
+        burst=int(os.environ.get('ADVICE_RATE_BURST', '10')),
+    ),
+)
+
+
+class InvalidRequest(Exception):
+    """A request the API refuses; both servers answer it with error_body and status"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def error_body(message):
+    return {'success': False, 'error': message}
+
+
+def request_data(method, body, args):
+    """The JSON body of a POST or the query string of a GET"""
+    if method != 'POST':
+        return args
+    if body is None:
+        return {}
+    if not isinstance(body, dict):
+        raise InvalidRequest("Request body must be a JSON object")
+    return body
+
+
+def check_rate_limit(remote_addr, headers, data, cost):
+    """Charge the client address and employee number; raises Rejected"""
+    address = client_address(remote_addr, headers.get('X-Forwarded-For'), PROXY_HOPS)
+    employee_number = data.get('employee_number') or headers.get('X-Employee-Number')
+    rate_limits.consume(address, employee_number, cost)
+
+
+def admission_priority(default_priority, headers):
+    """Clients may ask for a lower priority than the route default (X-Request-Priority), never a higher one"""
+    requested = PRIORITIES.get(headers.get('X-Request-Priority', ''), 0)
+    return max(PRIORITIES[default_priority], requested)
+
+
+def rejection(error):
+    """(body, status, headers) for a request refused by rate limiting or admission"""
+    return error_body(str(error)), 429, {'Retry-After': str(error.retry_after)}
+
+
+def batch_cost(data):
+    return len(data.get('questions') or []) or 1
+
+
+def request_class_of(data):
+    request_class = data.get('request_class', DEFAULT_REQUEST_CLASS)
+    if request_class not in ROUTES:
+        raise InvalidRequest(f"Unknown request_class: {request_class}")
+    return request_class
+
+
+def advice_params(method, data):
+    """(question, use_cache, request_class) for a single question"""
+    if method == 'POST':
+        use_cache = data.get('use_cache', True)
+    else:
+        use_cache = data.get('use_cache', 'true').lower() != 'false'
+    return data.get('question', ''), use_cache, request_class_of(data)
+
+
+def batch_params(data):
+    """(questions, use_cache, request_class) for a batch; items are checked with valid_question"""
+    questions = data.get('questions')
+    request_class = request_class_of(data)
+    if not isinstance(questions, list) or not questions:
+        raise InvalidRequest("'questions' must be a non-empty list")
+    if len(questions) > BATCH_MAX_QUESTIONS:
+        raise InvalidRequest(f"At most {BATCH_MAX_QUESTIONS} questions per batch")
+    return questions, data.get('use_cache', True), request_class
+
+
+INVALID_QUESTION = 'Question must be a non-empty string'
+
+
+def valid_question(question):
+    return isinstance(question, str) and bool(question.strip())
+
+
+def sse_event(payload, event=None):
+    message = f"data: {json.dumps(payload)}\n\n"
+    if event:
+        message = f"event: {event}\n{message}"
+    return message
+
+
+def api_stats(admission):
+    stats = advice_stats()
+    stats['admission'] = admission.stats()
+    stats['rate_limited'] = rate_limits.rejected
+    return stats
+
+
+def add_admission_gauges(admission):
+    def collect():
+        stats = admission.stats()
+        for kind in ('active', 'queued'):
+            metrics.admission_requests.set(stats[kind], kind=kind)
+
+    metrics.REGISTRY.add_collector(collect)
@@ -0,0 +1,187 @@
+"""Async variant of the advice API on Quart, Flask's asyncio counterpart.
+
+    uvicorn asgi_api:app --workers 4
+
+Serves the same routes and JSON as api.py and applies the same request policy
+(api_policy). Each request is a coroutine, so a slow Bedrock call or stream
+holds a few kilobytes of state rather than a thread, and one worker can keep
+thousands of requests waiting. Advice goes through get_financial_advice_async
+and stream_financial_advice_async, which share their caches, circuit breaker
+and Bedrock concurrency limiter with the sync path. Admission is sized for
+coroutines rather than threads. Request profiling is not available here.
+"""
+import asyncio
+import os
+from functools import wraps
+
+from quart import Quart, Response, jsonify, make_response, request
+from quart.wrappers.response import IterableBody, ResponseBody
+from quart_cors import cors
+
+import api_policy
+import metrics
+from admission import AsyncAdmissionController, Rejected
+from api_policy import (ADMISSION_QUEUE_TIMEOUT, BATCH_MAX_CONCURRENCY, EXPOSE_HEADERS, INVALID_QUESTION,
+                        MAX_BODY_BYTES, SSE_HEADERS, InvalidRequest, add_admission_gauges, admission_priority,
+                        advice_params, api_stats, batch_cost, batch_params, check_rate_limit, error_body,
+                        rejection, sse_event, valid_question)
+from bedrock_client import (async_bedrock_clients, get_financial_advice_async, stream_financial_advice_async,
+                            warm_up_bedrock)
+from knowledge_base import get_knowledge_base
+
+app = Quart(__name__)
+app.config['MAX_CONTENT_LENGTH'] = MAX_BODY_BYTES
+# Streams run as long as Bedrock takes; admission and the Bedrock deadlines bound them instead
+app.config['RESPONSE_TIMEOUT'] = None
+app = cors(app, allow_origin='*', expose_headers=EXPOSE_HEADERS)
+
+admission = AsyncAdmissionController(
+    max_active=int(os.environ.get('ASGI_ADMISSION_MAX_ACTIVE', '1024')),
+    max_queue=int(os.environ.get('ASGI_ADMISSION_MAX_QUEUE', '4096')),
+    queue_timeout=ADMISSION_QUEUE_TIMEOUT,
+)
+add_admission_gauges(admission)
+# Created on first use, inside the serving loop
+_batch_slots = None
+
+
+@app.before_serving
+async def prepare():
+    # Builds the sync client (credentials) and maps the index before the first request
+    await asyncio.get_running_loop().run_in_executor(None, lambda: (warm_up_bedrock(), get_knowledge_base()))
+
+
+@app.after_serving
+async def close_clients():
+    await async_bedrock_clients.close()
+
+
+@app.errorhandler(InvalidRequest)
+async def invalid_request(e):
+    return jsonify(error_body(str(e))), e.status
+
+
+async def request_data():
+    return api_policy.request_data(request.method, await request.get_json(silent=True), request.args)
+
+
+class _AdmittedBody(ResponseBody):
+    """A streamed body that gives its admission slot back once sent, or abandoned"""
+
+    def __init__(self, body):
+        self.body = body
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            admission.release()
+
+    async def __aenter__(self):
+        return await self.body.__aenter__()
+
+    async def __aexit__(self, exc_type, exc_value, tb):
+        try:
+            await self.body.__aexit__(exc_type, exc_value, tb)
+        finally:
+            self.release()
+
+    def __del__(self):
+        # The client went away before sending started, so __aexit__ never ran
+        self.release()
+
+
+def admitted(default_priority='interactive', cost=lambda data: 1):
+    """Same policy as api.admitted(): the slot is held until the response, including a stream, is sent"""
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(*args, **kwargs):
+            data = await request_data()
+            try:
+                check_rate_limit(request.remote_addr, request.headers, data, cost(data))
+                await admission.acquire(admission_priority(default_priority, request.headers))
+            except Rejected as e:
+                body, status, headers = rejection(e)
+                return jsonify(body), status, headers
+
+            try:
+                response = await make_response(await view(*args, **kwargs))
+            except BaseException:
+                admission.release()
+                raise
+            if isinstance(response.response, IterableBody):
+                response.response = _AdmittedBody(response.response)
+            else:
+                admission.release()
+            return response
+        return wrapper
+    return decorator
+
+
+@app.route('/api/advice', methods=['POST'])
+@admitted()
+async def get_advice():
+    question, use_cache, request_class = advice_params(request.method, await request_data())
+    try:
+        answer = await get_financial_advice_async(question, use_cache=use_cache, request_class=request_class)
+        return jsonify({'success': True, 'answer': answer})
+    except Exception as e:
+        return jsonify(error_body(str(e))), 500
+
+
+@app.route('/api/advice/batch', methods=['POST'])
+@admitted('batch', cost=batch_cost)
+async def get_advice_batch():
+    global _batch_slots
+    questions, use_cache, request_class = batch_params(await request_data())
+    if _batch_slots is None:
+        _batch_slots = asyncio.Semaphore(BATCH_MAX_CONCURRENCY)
+
+    async def answer(question):
+        if not valid_question(question):
+            return error_body(INVALID_QUESTION)
+        try:
+            async with _batch_slots:
+                text = await get_financial_advice_async(question, use_cache, request_class, fallback=False)
+            return {'success': True, 'answer': text}
+        except Exception as e:
+            return error_body(str(e))
+
+    results = await asyncio.gather(*(answer(question) for question in questions))
+    return jsonify({'success': True, 'results': list(results)})
+
+
+@app.route('/api/advice/stream', methods=['GET', 'POST'])
+@admitted()
+async def stream_advice():
+    # GET is for EventSource clients, POST mirrors /api/advice
+    question, use_cache, request_class = advice_params(request.method, await request_data())
+
+    async def generate():
+        # A client disconnect cancels this, which closes the Bedrock stream and frees its limiter slot
+        stream = stream_financial_advice_async(question, use_cache=use_cache, request_class=request_class)
+        try:
+            async for text in stream:
+                yield sse_event({'text': text})
+            yield sse_event({'success': True}, event='done')
+        except Exception as e:
+            yield sse_event(error_body(str(e)), event='error')
+        finally:
+            await stream.aclose()
+
+    return Response(generate(), mimetype='text/event-stream', headers=SSE_HEADERS)
+
+
+@app.route('/api/advice/stats', methods=['GET'])
+async def get_advice_stats():
+    return jsonify(api_stats(admission))
+
+
+@app.route('/metrics', methods=['GET'])
+async def get_metrics():
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/healthz', methods=['GET'])
+async def healthz():
+    return jsonify({'status': 'ok', 'pid': os.getpid()})
@@ -1,46 +1,935 @@
+import asyncio
 import boto3
 import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from botocore.config import Config
+import metrics
+from conversation_memory import estimate_tokens
+from knowledge_base import get_knowledge_base
+from model_routing import DEFAULT_REQUEST_CLASS, PROMPT_CACHE_MIN_TOKENS, LatencyTracker, get_route
+from recommendations import RecommendationFormatError, parse_fragments, structured_question
+from resilience import (AdaptiveLimiter, CircuitBreaker, CircuitOpenError, LimiterTimeout, is_throttling,
+                        retry_call, retry_call_async)
+from response_cache import AsyncSingleFlight, ResponseCache, SingleFlight, make_cache_key
+
+BEDROCK_REGION = os.environ.get('BEDROCK_REGION', 'us-east-1')
+BEDROCK_MAX_POOL_CONNECTIONS = int(os.environ.get('BEDROCK_MAX_POOL_CONNECTIONS', '50'))
+BEDROCK_CONNECT_TIMEOUT = float(os.environ.get('BEDROCK_CONNECT_TIMEOUT', '2'))
+BEDROCK_READ_TIMEOUT = float(os.environ.get('BEDROCK_READ_TIMEOUT', '30'))
+BEDROCK_MAX_ATTEMPTS = int(os.environ.get('BEDROCK_MAX_ATTEMPTS', '3'))
+BEDROCK_RETRY_DEADLINE = float(os.environ.get('BEDROCK_RETRY_DEADLINE', '20'))
+BEDROCK_HEDGING = os.environ.get('BEDROCK_HEDGING', 'false').lower() == 'true'
+STRUCTURED_MAX_ATTEMPTS = int(os.environ.get('STRUCTURED_MAX_ATTEMPTS', '2'))
+BEDROCK_PROMPT_CACHING = os.environ.get('BEDROCK_PROMPT_CACHING', 'true').lower() == 'true'
+# Send every plan document in the static system block; worthwhile once it is large enough to cache
+BEDROCK_PLAN_CONTEXT = os.environ.get('BEDROCK_PLAN_CONTEXT', 'false').lower() == 'true'
+
+MODEL_ID = 'amazon.nova-micro-v1:0'
+SYSTEM_PREAMBLE = "You are a benefits advisor."
+INFERENCE_CONFIG = {
+    "max_new_tokens": 1000,
+    "temperature": 0.7
+}
+
+ADVICE_CACHE_MAX_ENTRIES = int(os.environ.get('ADVICE_CACHE_MAX_ENTRIES', '1024'))
+ADVICE_CACHE_TTL_SECONDS = float(os.environ.get('ADVICE_CACHE_TTL_SECONDS', '3600'))
+
+
+class BedrockClientManager:
+    """Process-wide, thread-safe owner of a pooled bedrock-runtime client"""
+
+    def __init__(self, region_name=BEDROCK_REGION, max_pool_connections=BEDROCK_MAX_POOL_CONNECTIONS,
+                 tcp_keepalive=True, connect_timeout=BEDROCK_CONNECT_TIMEOUT, read_timeout=BEDROCK_READ_TIMEOUT):
+        self.region_name = region_name
+        self.max_pool_connections = max_pool_connections
+        self.tcp_keepalive = tcp_keepalive
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self._client = None
+        self._lock = threading.Lock()
+
+    def configure(self, **settings):
+        # Takes effect on the next get_client(); in-flight callers keep the old client
+        with self._lock:
+            for key, value in settings.items():
+                if not hasattr(self, key) or key.startswith('_'):
+                    raise ValueError(f"Unknown Bedrock client setting: {key}")
+                setattr(self, key, value)
+            self._client = None
+
+    def _build_client(self):
+        # boto3 sessions are not thread-safe, so each client gets its own
+        session = boto3.session.Session()
+        config = Config(
+            max_pool_connections=self.max_pool_connections,
+            tcp_keepalive=self.tcp_keepalive,
+            connect_timeout=self.connect_timeout,
+            read_timeout=self.read_timeout,
+            # Retries are done by retry_call so they share one deadline and the circuit breaker
+            retries={'total_max_attempts': 1, 'mode': 'standard'},
+        )
+        return session.client('bedrock-runtime', region_name=self.region_name, config=config)
+
+    def set_client(self, client):
+        """Use a ready-made client, e.g. the fake backend in benchmark.py"""
+        with self._lock:
+            self._client = client
+
+    def get_client(self):
+        client = self._client
+        if client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._build_client()
+                client = self._client
+        return client
+
+    def warm_up(self, ping=False):
+        """Build the client (credentials + endpoint) ahead of the first request.
+
+        With ping=True a one-token request is also sent so a TLS connection is
+        already sitting in the pool.
+        """
+        try:
+            client = self.get_client()
+            if ping:
+                client.invoke_model(
+                    modelId=MODEL_ID,
+                    body=json.dumps({
+                        "messages": [{"role": "user", "content": [{"text": "Hi"}]}],
+                        "inferenceConfig": {"max_new_tokens": 1}
+                    })
+                )
+            return True
+        except Exception as e:
+            print(f"Bedrock warm-up failed: {e}")
+            return False
+
+
+class AsyncBedrockClientManager:
+    """Owner of aiobotocore bedrock-runtime clients for the async advice path.
+
+    aiohttp connections belong to the event loop that opened them, so each
+    running loop gets its own client. Settings follow bedrock_clients.
+    """
+
+    def __init__(self, settings):
+        self.settings = settings
+        self._clients = {}
+        self._override = None
+
+    def set_client(self, client):
+        """Use a ready-made async client on every loop, e.g. benchmark.AsyncFakeBedrock"""
+        self._override = client
+
+    async def _build_client(self):
+        # Imported here so the sync path works without aiobotocore installed
+        from aiobotocore.config import AioConfig
+        from aiobotocore.session import get_session
+        settings = self.settings
+        config = AioConfig(
+            max_pool_connections=settings.max_pool_connections,
+            tcp_keepalive=settings.tcp_keepalive,
+            connect_timeout=settings.connect_timeout,
+            read_timeout=settings.read_timeout,
+            retries={'total_max_attempts': 1, 'mode': 'standard'},
+        )
+        context = get_session().create_client('bedrock-runtime', region_name=settings.region_name, config=config)
+        return context, await context.__aenter__()
+
+    async def get_client(self):
+        if self._override is not None:
+            return self._override
+        loop = asyncio.get_running_loop()
+        entry = self._clients.get(loop)
+        if entry is None:
+            entry = await self._build_client()
+            # Another coroutine may have built one while we awaited; keep the first
+            if loop in self._clients:
+                await entry[0].__aexit__(None, None, None)
+            else:
+                self._clients[loop] = entry
+            entry = self._clients[loop]
+        return entry[1]
+
+    async def close(self):
+        """Close the running loop's client; call before the loop shuts down"""
+        entry = self._clients.pop(asyncio.get_running_loop(), None)
+        if entry is not None:
+            await entry[0].__aexit__(None, None, None)
+
+
+bedrock_clients = BedrockClientManager()
+async_bedrock_clients = AsyncBedrockClientManager(bedrock_clients)
+advice_cache = ResponseCache(max_entries=ADVICE_CACHE_MAX_ENTRIES, ttl_seconds=ADVICE_CACHE_TTL_SECONDS)
+advice_flight = SingleFlight()
+# The async path coalesces separately: its waiters must not block the event loop on a thread's call
+async_advice_flight = AsyncSingleFlight()
+bedrock_breaker = CircuitBreaker(
+    failure_threshold=float(os.environ.get('BEDROCK_BREAKER_FAILURE_THRESHOLD', '0.5')),
+    min_calls=int(os.environ.get('BEDROCK_BREAKER_MIN_CALLS', '10')),
+    cooldown_seconds=float(os.environ.get('BEDROCK_BREAKER_COOLDOWN_SECONDS', '30')),
+    trial_timeout_seconds=float(os.environ.get('BEDROCK_BREAKER_TRIAL_TIMEOUT_SECONDS', '60')),
+)
+# Shared by every caller in the process (UI and API) since they draw on one Bedrock quota
+bedrock_limiter = AdaptiveLimiter(
+    initial_limit=int(os.environ.get('BEDROCK_CONCURRENCY_INITIAL', '8')),
+    min_limit=int(os.environ.get('BEDROCK_CONCURRENCY_MIN', '1')),
+    max_limit=int(os.environ.get('BEDROCK_CONCURRENCY_MAX', '64')),
+    queue_timeout=float(os.environ.get('BEDROCK_QUEUE_TIMEOUT', '10')),
+)
+
+_fallback_counts = {'error': 0, 'circuit_open': 0, 'overloaded': 0, 'invalid_output': 0, 'empty': 0}
+_stats_lock = threading.Lock()
+
+model_latency = LatencyTracker()
+_hedge_executor = ThreadPoolExecutor(max_workers=BEDROCK_MAX_POOL_CONNECTIONS, thread_name_prefix='bedrock-hedge')
+_hedge_counts = {'launched': 0, 'won': 0}
+
+
+def _collect_gauges():
+    limiter = bedrock_limiter.stats()
+    for kind in ('limit', 'in_flight', 'waiting'):
+        metrics.bedrock_concurrency.set(limiter[kind], kind=kind)
+    metrics.bedrock_circuit_open.set(1 if bedrock_breaker.state == CircuitBreaker.OPEN else 0)
+
+
+metrics.REGISTRY.add_collector(_collect_gauges)
+
+
+def shutdown_executors():
+    _hedge_executor.shutdown(wait=True)
+
+
+def get_bedrock_client():
+    return bedrock_clients.get_client()
+
+
+def warm_up_bedrock(ping=False):
+    return bedrock_clients.warm_up(ping=ping)
+
+
+# For first-time Anthropic users, you may need to go to:
+# AWS Console → Bedrock → Model catalog → Claude 3 Haiku → Use case details
+FALLBACK_RESPONSE = """Based on your profile, here are my recommendations:
+
+**Health Insurance**: Consider a mid-tier plan that balances cost and coverage.
+
+**Dental & Vision**: Basic coverage recommended for preventive care.
+
+**Employee Assistance Program**: Valuable for work-life balance support.
+
+*Note: Demo response. For Anthropic models, first-time users may need to submit use case details in AWS Console → Bedrock → Model catalog.*"""
+
+
+def system_prompt():
+    """The static part of every prompt: identical across requests, so it can be cached"""
+    if not BEDROCK_PLAN_CONTEXT:
+        return SYSTEM_PREAMBLE
+    context = get_knowledge_base().plan_context()
+    if not context:
+        return SYSTEM_PREAMBLE
+    return f"{SYSTEM_PREAMBLE}\n\nPlan information for this employer:\n\n{context}"
+
+
+def system_blocks(model_id=MODEL_ID):
+    text = system_prompt()
+    blocks = [{"text": text}]
+    min_tokens = PROMPT_CACHE_MIN_TOKENS.get(model_id)
+    if BEDROCK_PROMPT_CACHING and min_tokens and estimate_tokens(text) >= min_tokens:
+        # Everything before the checkpoint is cached; the user block after it varies per request
+        blocks.append({"cachePoint": {"type": "default"}})
+    return blocks
+
+
+def build_request_body(question, inference_config=INFERENCE_CONFIG, model_id=MODEL_ID):
+    return json.dumps({
+        "system": system_blocks(model_id),
+        "messages": [{
+            "role": "user",
+            "content": [{
+                "text": question
+            }]
+        }],
+        "inferenceConfig": inference_config
+    })
+
+
+def advice_cache_key(question, request_class=DEFAULT_REQUEST_CLASS):
+    # Keyed on the primary model: any model in the chain answers for the same route
+    route = get_route(request_class)
+    return make_cache_key(question, route.models[0], route.inference_config)
+
+
+class AdviceUnavailable(Exception):
+    """No real answer could be produced; raised instead of returning FALLBACK_RESPONSE when fallback=False"""
+
+    def __init__(self, reason):
+        super().__init__(f"Advice unavailable ({reason})")
+        self.reason = reason
+
+
+def _fallback(reason):
+    with _stats_lock:
+        _fallback_counts[reason] += 1
+    metrics.fallbacks.inc(reason=reason)
+    # The fallback is never cached so the real answer is fetched once Bedrock recovers
+    return FALLBACK_RESPONSE
+
+
+def _fallback_reason(error):
+    if isinstance(error, CircuitOpenError):
+        return 'circuit_open'
+    if isinstance(error, LimiterTimeout):
+        return 'overloaded'
+    print(f"Bedrock error: {error}")
+    return 'error'
+
+
+def _fallback_for(error):
+    return _fallback(_fallback_reason(error))
+
+
+def _unavailable(reason, fallback):
+    """FALLBACK_RESPONSE, or AdviceUnavailable for callers that report the failure themselves"""
+    answer = _fallback(reason)
+    if not fallback:
+        raise AdviceUnavailable(reason)
+    return answer
+
+
+def _call_with_retries(fn, slot):
+    """Run fn under the circuit breaker with retries; the caller holds a limiter slot"""
+    if not bedrock_breaker.allow():
+        raise CircuitOpenError("Bedrock circuit breaker is open")
+
+    def attempt():
+        try:
+            return fn()
+        except Exception as e:
+            if is_throttling(e):
+                bedrock_limiter.record_throttle(slot)
+            raise
 
-def get_financial_advice(question):
     try:
-        client = boto3.client('bedrock-runtime', region_name='us-east-1')
-        
+        return retry_call(attempt, max_attempts=BEDROCK_MAX_ATTEMPTS, deadline=BEDROCK_RETRY_DEADLINE)
+    except Exception:
+        bedrock_breaker.record_failure()
+        raise
+    except BaseException:
+        # Interrupted with no outcome; don't leave a half-open trial claimed forever
+        bedrock_breaker.release_trial()
+        raise
+
+
+def _record_usage(model_id, usage):
+    """Count the tokens in a usage block; return how the prompt cache was used ('read', 'write' or 'none')"""
+    # Nova reports inputTokens/outputTokens; stream metrics use inputTokenCount/outputTokenCount
+    input_tokens = usage.get('inputTokens', usage.get('inputTokenCount'))
+    output_tokens = usage.get('outputTokens', usage.get('outputTokenCount'))
+    cache_read = usage.get('cacheReadInputTokenCount', usage.get('cacheReadInputTokens')) or 0
+    cache_write = usage.get('cacheWriteInputTokenCount', usage.get('cacheWriteInputTokens')) or 0
+    if input_tokens is not None:
+        metrics.bedrock_tokens.inc(input_tokens, model=model_id, direction='input')
+    if output_tokens is not None:
+        metrics.bedrock_tokens.inc(output_tokens, model=model_id, direction='output')
+    if cache_read:
+        metrics.bedrock_tokens.inc(cache_read, model=model_id, direction='cache_read')
+    if cache_write:
+        metrics.bedrock_tokens.inc(cache_write, model=model_id, direction='cache_write')
+    return 'read' if cache_read else 'write' if cache_write else 'none'
+
+
+def _acquire_slot():
+    with metrics.stage_seconds.time(stage='bedrock_queue'):
+        return bedrock_limiter.acquire()
+
+
+class _ModelCall:
+    """Limiter slot, timings and metrics for one Bedrock call, shared by the sync and async paths"""
+
+    def __init__(self, model_id, slot):
+        self.model_id = model_id
+        self.slot = slot
+        self.started = time.monotonic()
+        self.first_token = None
+        self.prompt_cache = 'unknown'
+        self.failed = False
+
+    def not_answered(self, error=True):
+        """The request failed, or was cancelled (error=False), before Bedrock answered"""
+        bedrock_limiter.release(self.slot, success=False)
+        if error:
+            metrics.bedrock_errors.inc(model=self.model_id)
+
+    def answered(self, result):
+        """Record a complete invoke_model response and return its text"""
+        elapsed = time.monotonic() - self.started
+        model_latency.record(self.model_id, elapsed)
+        metrics.bedrock_call_seconds.observe(elapsed, model=self.model_id, operation='invoke')
+        _record_usage(self.model_id, result.get('usage', {}))
+        bedrock_limiter.release(self.slot)
+        bedrock_breaker.record_success()
+        return result['output']['message']['content'][0]['text']
+
+    def stream_text(self, event):
+        """The text delta in one response-stream event, if any; usage blocks are recorded as they pass"""
+        chunk = event.get('chunk')
+        if not chunk:
+            return None
+        payload = json.loads(chunk['bytes'])
+        if 'metadata' in payload:
+            self.prompt_cache = _record_usage(self.model_id, payload['metadata'].get('usage', {}))
+        elif 'amazon-bedrock-invocationMetrics' in payload:
+            self.prompt_cache = _record_usage(self.model_id, payload['amazon-bedrock-invocationMetrics'])
+        text = payload.get('contentBlockDelta', {}).get('delta', {}).get('text')
+        if text and self.first_token is None:
+            self.first_token = time.monotonic() - self.started
+        return text
+
+    def stream_failed(self):
+        self.failed = True
+        bedrock_breaker.record_failure()
+        metrics.bedrock_errors.inc(model=self.model_id)
+
+    def stream_closed(self):
+        metrics.bedrock_call_seconds.observe(time.monotonic() - self.started, model=self.model_id,
+                                             operation='stream')
+        if self.first_token is not None:
+            # Observed at the end because usage, and so the prompt-cache outcome, arrives last
+            metrics.bedrock_first_token_seconds.observe(self.first_token, model=self.model_id,
+                                                        prompt_cache=self.prompt_cache)
+        bedrock_limiter.release(self.slot, success=not self.failed)
+        # A stream abandoned by the consumer still counts as Bedrock having worked
+        if not self.failed:
+            bedrock_breaker.record_success()
+
+
+def _hedge_budget(route):
+    """How long the primary model gets before the alternate is raced against it"""
+    return model_latency.percentile(route.models[0], 95) or route.latency_budget
+
+
+def _count_hedge(outcome):
+    with _stats_lock:
+        _hedge_counts[outcome] += 1
+
+
+def _invoke_model(question, model_id=MODEL_ID, inference_config=INFERENCE_CONFIG):
+    client = get_bedrock_client()
+    with metrics.stage_seconds.time(stage='prompt_build'):
+        body = build_request_body(question, inference_config, model_id)
+
+    def invoke():
         # Try Amazon Nova first (should be available without approval)
-        body = json.dumps({
-            "messages": [{
-                "role": "user",
-                "content": [{
-                    "text": f"You are a benefits advisor. {question}"
-                }]
-            }],
-            "inferenceConfig": {
-                "max_new_tokens": 1000,
-                "temperature": 0.7
-            }
-        })
-        
         response = client.invoke_model(
-            modelId='amazon.nova-micro-v1:0',
+            modelId=model_id,
             body=body
         )
-        
-        result = json.loads(response['body'].read())
-        return result['output']['message']['content'][0]['text']
-        
+        return json.loads(response['body'].read())
+
+    call = _ModelCall(model_id, _acquire_slot())
+    try:
+        result = _call_with_retries(invoke, call.slot)
+    except Exception:
+        call.not_answered()
+        raise
+    return call.answered(result)
+
+
+def _invoke_hedged(question, route):
+    """Call the primary model; if it runs past its p95 budget, race the alternate against it"""
+    primary, alternate = route.models[0], route.models[1]
+    first = _hedge_executor.submit(_invoke_model, question, primary, route.inference_config)
+    done, _ = wait([first], timeout=_hedge_budget(route))
+    if done:
+        try:
+            return first.result()
+        except (CircuitOpenError, LimiterTimeout):
+            raise
+        except Exception as e:
+            # Failed before a hedge was due; the alternate still gets its turn
+            print(f"Bedrock error ({primary}): {e}")
+        return _invoke_model(question, alternate, route.inference_config)
+
+    _count_hedge('launched')
+    second = _hedge_executor.submit(_invoke_model, question, alternate, route.inference_config)
+    pending = {first, second}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                if future is second:
+                    _count_hedge('won')
+                # The slower call keeps running in the background; its result is dropped
+                return future.result()
+            error = future.exception()
+    raise error
+
+
+def _invoke_route(question, route):
+    """Walk the route's fallback chain until a model answers"""
+    models = list(route.models)
+    error = None
+    if BEDROCK_HEDGING and route.hedge and len(models) > 1:
+        try:
+            return _invoke_hedged(question, route)
+        except (CircuitOpenError, LimiterTimeout):
+            raise
+        except Exception as e:
+            print(f"Bedrock error (hedged {models[0]}/{models[1]}): {e}")
+            error = e
+            models = models[2:]
+    for model_id in models:
+        try:
+            return _invoke_model(question, model_id, route.inference_config)
+        except (CircuitOpenError, LimiterTimeout):
+            # Process-wide conditions; another model would be refused the same way
+            raise
+        except Exception as e:
+            print(f"Bedrock error ({model_id}): {e}")
+            error = e
+    raise error
+
+
+def _stream_model(question, model_id=MODEL_ID, inference_config=INFERENCE_CONFIG):
+    client = get_bedrock_client()
+    with metrics.stage_seconds.time(stage='prompt_build'):
+        body = build_request_body(question, inference_config, model_id)
+    # The slot is held for the whole stream, since generation is what uses the quota
+    call = _ModelCall(model_id, _acquire_slot())
+    try:
+        response = _call_with_retries(lambda: client.invoke_model_with_response_stream(
+            modelId=model_id,
+            body=body
+        ), call.slot)
+    except Exception:
+        call.not_answered()
+        raise
+    try:
+        for event in response['body']:
+            text = call.stream_text(event)
+            if text:
+                yield text
+    except Exception:
+        call.stream_failed()
+        raise
+    finally:
+        response['body'].close()
+        call.stream_closed()
+
+
+def _stream_route(question, route):
+    # Fall back to the next model only while nothing has been sent yet
+    error = None
+    for model_id in route.models:
+        stream = _stream_model(question, model_id, route.inference_config)
+        try:
+            first = next(stream)
+        except StopIteration:
+            return
+        except (CircuitOpenError, LimiterTimeout):
+            raise
+        except Exception as e:
+            print(f"Bedrock error ({model_id}): {e}")
+            error = e
+            continue
+        yield first
+        yield from stream
+        return
+    raise error
+
+
+def _cached_answer(key, request_class):
+    cached = advice_cache.get(key)
+    metrics.cache_lookups.inc(request_class=request_class, result='miss' if cached is None else 'hit')
+    return cached
+
+
+def _cache_answer(key, answer):
+    # A blank or fallback answer would otherwise be served for the whole TTL
+    if answer.strip() and answer != FALLBACK_RESPONSE:
+        advice_cache.set(key, answer)
+
+
+def get_financial_advice(question, use_cache=True, request_class=DEFAULT_REQUEST_CLASS, fallback=True):
+    """Answer a question, from cache when possible.
+
+    If Bedrock fails, sheds the request or answers with nothing, returns
+    FALLBACK_RESPONSE, or raises AdviceUnavailable when fallback is False.
+    """
+    route = get_route(request_class)
+    key = advice_cache_key(question, request_class)
+    if use_cache:
+        cached = _cached_answer(key, request_class)
+        if cached is not None:
+            return cached
+
+    try:
+        # Identical requests already in flight share one Bedrock call
+        answer = advice_flight.do(key, lambda: _invoke_route(question, route))
     except Exception as e:
-        # For first-time Anthropic users, you may need to go to:
-        # AWS Console → Bedrock → Model catalog → Claude 3 Haiku → Use case details
-        print(f"Bedrock error: {e}")
-        return f"""Based on your profile, here are my recommendations:
+        return _unavailable(_fallback_reason(e), fallback)
 
-**Health Insurance**: Consider a mid-tier plan that balances cost and coverage.
+    if answer is None:
+        # We waited on a stream whose client disconnected before it finished
+        return get_financial_advice(question, use_cache, request_class, fallback)
+    if not answer.strip():
+        return _unavailable('empty', fallback)
+    _cache_answer(key, answer)
+    return answer
 
-**Dental & Vision**: Basic coverage recommended for preventive care.
 
-**Employee Assistance Program**: Valuable for work-life balance support.
+def get_structured_recommendations(question, benefits, request_class='recommendation'):
+    """Ask for recommendations in the recommendations.py schema and validate them.
 
-*Note: Demo response. For Anthropic models, first-time users may need to submit use case details in AWS Console → Bedrock → Model catalog.*"""
+    Returns {benefit: {'tier', 'rationale', 'cost_notes'}} in `benefits`
+    order, or None if Bedrock is unavailable or every attempt came back
+    malformed; callers show FALLBACK_RESPONSE then. Only answers that pass
+    validation are cached, and a malformed one is asked for again.
+    """
+    benefits = list(benefits)
+    prompt = structured_question(question, benefits)
+    route = get_route(request_class)
+    key = advice_cache_key(prompt, request_class)
+    cached = _cached_answer(key, request_class)
+    if cached is not None:
+        return parse_fragments(cached, benefits)
+
+    for attempt in range(1, STRUCTURED_MAX_ATTEMPTS + 1):
+        try:
+            answer = advice_flight.do(key, lambda: _invoke_route(prompt, route))
+        except Exception as e:
+            _fallback_for(e)
+            return None
+        if answer is None:
+            continue
+        try:
+            fragments = parse_fragments(answer, benefits)
+        except RecommendationFormatError as e:
+            print(f"Malformed recommendation (attempt {attempt}): {e}")
+            continue
+        _cache_answer(key, answer)
+        return fragments
+    _fallback('invalid_output')
+    return None
+
+
+def stream_financial_advice(question, use_cache=True, request_class=DEFAULT_REQUEST_CLASS):
+    """Yield the answer as text deltas as soon as Bedrock produces them.
+
+    A cached answer is yielded as a single chunk, as is the answer for a
+    request that joined an identical one already in flight. Falls back to the
+    demo response if the stream cannot be opened or ends with no text. If it
+    breaks part-way the error is raised after the text already sent, so
+    callers can tell the answer is incomplete; that text is not cached.
+    """
+    route = get_route(request_class)
+    key = advice_cache_key(question, request_class)
+    if use_cache:
+        cached = _cached_answer(key, request_class)
+        if cached is not None:
+            yield cached
+            return
+
+    call, leader = advice_flight.begin(key)
+    if not leader:
+        try:
+            answer = advice_flight.wait(call)
+        except Exception as e:
+            answer = _fallback_for(e)
+        if answer is None:
+            yield from stream_financial_advice(question, use_cache, request_class)
+        elif answer.strip():
+            yield answer
+        else:
+            yield _fallback('empty')
+        return
+
+    parts = []
+    try:
+        for text in _stream_route(question, route):
+            parts.append(text)
+            yield text
+        answer = ''.join(parts)
+        _cache_answer(key, answer)
+        advice_flight.finish(key, call, result=answer)
+        if not answer.strip():
+            yield _fallback('empty')
+    except Exception as e:
+        advice_flight.finish(key, call, error=e)
+        if parts:
+            print(f"Bedrock stream error: {e}")
+            raise
+        yield _fallback_for(e)
+    finally:
+        if not call.done.is_set():
+            # Consumer stopped reading early; release anyone waiting on us
+            advice_flight.finish(key, call)
+
+
+async def _call_with_retries_async(fn, slot):
+    if not bedrock_breaker.allow():
+        raise CircuitOpenError("Bedrock circuit breaker is open")
+
+    async def attempt():
+        try:
+            return await fn()
+        except Exception as e:
+            if is_throttling(e):
+                bedrock_limiter.record_throttle(slot)
+            raise
+
+    try:
+        return await retry_call_async(attempt, max_attempts=BEDROCK_MAX_ATTEMPTS, deadline=BEDROCK_RETRY_DEADLINE)
+    except Exception:
+        bedrock_breaker.record_failure()
+        raise
+    except BaseException:
+        # Cancelled (a hedge loser, a client that went away) with no outcome;
+        # don't leave a half-open trial claimed forever
+        bedrock_breaker.release_trial()
+        raise
+
+
+async def _acquire_slot_async():
+    with metrics.stage_seconds.time(stage='bedrock_queue'):
+        return await bedrock_limiter.acquire_async()
+
+
+async def _invoke_model_async(question, model_id=MODEL_ID, inference_config=INFERENCE_CONFIG):
+    client = await async_bedrock_clients.get_client()
+    with metrics.stage_seconds.time(stage='prompt_build'):
+        body = build_request_body(question, inference_config, model_id)
+
+    async def invoke():
+        response = await client.invoke_model(modelId=model_id, body=body)
+        return json.loads(await response['body'].read())
+
+    call = _ModelCall(model_id, await _acquire_slot_async())
+    try:
+        result = await _call_with_retries_async(invoke, call.slot)
+    except asyncio.CancelledError:
+        # e.g. the losing side of a hedge; the slot must still be returned
+        call.not_answered(error=False)
+        raise
+    except Exception:
+        call.not_answered()
+        raise
+    return call.answered(result)
+
+
+def _discard_result(task):
+    if not task.cancelled():
+        task.exception()
+
+
+async def _invoke_hedged_async(question, route):
+    primary, alternate = route.models[0], route.models[1]
+    first = asyncio.ensure_future(_invoke_model_async(question, primary, route.inference_config))
+    first.add_done_callback(_discard_result)
+    done, _ = await asyncio.wait({first}, timeout=_hedge_budget(route))
+    if done:
+        try:
+            return first.result()
+        except (CircuitOpenError, LimiterTimeout):
+            raise
+        except Exception as e:
+            print(f"Bedrock error ({primary}): {e}")
+        return await _invoke_model_async(question, alternate, route.inference_config)
+
+    _count_hedge('launched')
+    second = asyncio.ensure_future(_invoke_model_async(question, alternate, route.inference_config))
+    second.add_done_callback(_discard_result)
+    pending = {first, second}
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is second:
+                        _count_hedge('won')
+                    return task.result()
+                error = task.exception()
+    finally:
+        # Unlike a thread, the slower call can be stopped, which frees its limiter slot
+        for task in pending:
+            task.cancel()
+    raise error
+
+
+async def _invoke_route_async(question, route):
+    models = list(route.models)
+    error = None
+    if BEDROCK_HEDGING and route.hedge and len(models) > 1:
+        try:
+            return await _invoke_hedged_async(question, route)
+        except (CircuitOpenError, LimiterTimeout):
+            raise
+        except Exception as e:
+            print(f"Bedrock error (hedged {models[0]}/{models[1]}): {e}")
+            error = e
+            models = models[2:]
+    for model_id in models:
+        try:
+            return await _invoke_model_async(question, model_id, route.inference_config)
+        except (CircuitOpenError, LimiterTimeout):
+            raise
+        except Exception as e:
+            print(f"Bedrock error ({model_id}): {e}")
+            error = e
+    raise error
+
+
+async def _stream_model_async(question, model_id=MODEL_ID, inference_config=INFERENCE_CONFIG):
+    client = await async_bedrock_clients.get_client()
+    with metrics.stage_seconds.time(stage='prompt_build'):
+        body = build_request_body(question, inference_config, model_id)
+    call = _ModelCall(model_id, await _acquire_slot_async())
+    try:
+        response = await _call_with_retries_async(lambda: client.invoke_model_with_response_stream(
+            modelId=model_id,
+            body=body
+        ), call.slot)
+    except asyncio.CancelledError:
+        call.not_answered(error=False)
+        raise
+    except Exception:
+        call.not_answered()
+        raise
+    try:
+        async for event in response['body']:
+            text = call.stream_text(event)
+            if text:
+                yield text
+    except Exception:
+        call.stream_failed()
+        raise
+    finally:
+        response['body'].close()
+        call.stream_closed()
+
+
+async def _stream_route_async(question, route):
+    error = None
+    for model_id in route.models:
+        stream = _stream_model_async(question, model_id, route.inference_config)
+        try:
+            first = await stream.__anext__()
+        except StopAsyncIteration:
+            return
+        except (CircuitOpenError, LimiterTimeout):
+            raise
+        except Exception as e:
+            print(f"Bedrock error ({model_id}): {e}")
+            error = e
+            continue
+        try:
+            yield first
+            async for text in stream:
+                yield text
+        finally:
+            await stream.aclose()
+        return
+    raise error
+
+
+async def get_financial_advice_async(question, use_cache=True, request_class=DEFAULT_REQUEST_CLASS, fallback=True):
+    """get_financial_advice for asyncio callers.
+
+    Waiting on Bedrock, the limiter or an identical in-flight request holds
+    no thread. Shares the caches, circuit breaker and concurrency limiter
+    with the sync path.
+    """
+    route = get_route(request_class)
+    key = advice_cache_key(question, request_class)
+    if use_cache:
+        cached = _cached_answer(key, request_class)
+        if cached is not None:
+            return cached
+
+    try:
+        answer = await async_advice_flight.do(key, lambda: _invoke_route_async(question, route))
+    except Exception as e:
+        return _unavailable(_fallback_reason(e), fallback)
+
+    if answer is None:
+        # The request we joined was cancelled before it finished
+        return await get_financial_advice_async(question, use_cache, request_class, fallback)
+    if not answer.strip():
+        return _unavailable('empty', fallback)
+    _cache_answer(key, answer)
+    return answer
+
+
+async def stream_financial_advice_async(question, use_cache=True, request_class=DEFAULT_REQUEST_CLASS):
+    """Async generator counterpart of stream_financial_advice"""
+    route = get_route(request_class)
+    key = advice_cache_key(question, request_class)
+    if use_cache:
+        cached = _cached_answer(key, request_class)
+        if cached is not None:
+            yield cached
+            return
+
+    call, leader = async_advice_flight.begin(key)
+    if not leader:
+        try:
+            answer = await async_advice_flight.wait(call)
+        except Exception as e:
+            answer = _fallback_for(e)
+        if answer is None:
+            async for text in stream_financial_advice_async(question, use_cache, request_class):
+                yield text
+        elif answer.strip():
+            yield answer
+        else:
+            yield _fallback('empty')
+        return
+
+    parts = []
+    stream = _stream_route_async(question, route)
+    try:
+        async for text in stream:
+            parts.append(text)
+            yield text
+        answer = ''.join(parts)
+        _cache_answer(key, answer)
+        async_advice_flight.finish(key, call, result=answer)
+        if not answer.strip():
+            yield _fallback('empty')
+    except Exception as e:
+        async_advice_flight.finish(key, call, error=e)
+        if parts:
+            print(f"Bedrock stream error: {e}")
+            raise
+        yield _fallback_for(e)
+    finally:
+        await stream.aclose()
+        # Consumer stopped reading early (or was cancelled); waiters retry on None
+        async_advice_flight.finish(key, call)
+
+
+def advice_stats():
+    with _stats_lock:
+        fallbacks = dict(_fallback_counts)
+        hedges = dict(_hedge_counts)
+    return {
+        'cache': advice_cache.stats(),
+        'single_flight': advice_flight.stats(),
+        'async_single_flight': async_advice_flight.stats(),
+        'circuit_breaker': bedrock_breaker.stats(),
+        'concurrency': bedrock_limiter.stats(),
+        'fallbacks': fallbacks,
+        'model_latency': model_latency.stats(),
+        'hedges': hedges,
+    }
 
 if __name__ == "__main__":
     advice = get_financial_advice("What health insurance options are available?")
-    print("Answer:", advice)
\ No newline at end of file
+    print("Answer:", advice)
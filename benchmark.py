@@ -0,0 +1,633 @@
+#!/usr/bin/env python3
+"""Load-test the advice pipeline and API against an in-process fake Bedrock backend.
+
+Nothing here talks to AWS: the Bedrock client is replaced by FakeBedrock,
+whose latency, throttling rate and token counts are set from the command
+line, and profile reads/writes go to FakeTable, an in-memory stand-in for
+UserBenefitsContext. Load is closed-loop (a fixed number of workers, each
+sending its next request as soon as the last one returns) or open-loop
+(Poisson arrivals at a fixed rate, latency measured from the scheduled
+arrival so a slow server cannot hide its queueing).
+
+Each scenario runs in a fresh subprocess so caches, the circuit breaker and
+the concurrency limiter start from the same state every time. Results are
+JSON; pass an earlier file to --compare to see the change per scenario.
+
+    python benchmark.py --scenario all --output bench.json
+    python benchmark.py --scenario api --mode open --rate 40 --compare bench.json
+"""
+import argparse
+import asyncio
+import copy
+import datetime
+import io
+import json
+import math
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+import zlib
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+SCENARIOS = ['advice', 'stream', 'api', 'api_stream', 'asgi', 'asgi_stream', 'profile']
+TOPICS = ['HMO and PPO plans', 'an FSA', 'an HSA', 'dental coverage', 'vision coverage',
+          'the employee assistance program', 'caregiver resources', 'tutoring support',
+          'deductibles', 'open enrollment']
+
+
+class FakeBedrock:
+    """Stands in for a bedrock-runtime client.
+
+    Latency is lognormal around `latency_ms`; a `throttle_rate` fraction of
+    calls fail with ThrottlingException after `throttle_latency_ms`. Streams
+    send the first chunk after `ttft_fraction` of the call's latency and
+    spread the rest evenly. A system prefix ending in a cachePoint is reported
+    as a cache write the first time it is seen and a cache read after that.
+    """
+
+    def __init__(self, latency_ms=400, latency_sigma=0.5, throttle_rate=0.0, throttle_latency_ms=20,
+                 output_tokens=300, tokens_per_chunk=20, ttft_fraction=0.3, seed=0):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.throttle_rate = throttle_rate
+        self.throttle_latency_ms = throttle_latency_ms
+        self.output_tokens = output_tokens
+        self.tokens_per_chunk = tokens_per_chunk
+        self.ttft_fraction = ttft_fraction
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.throttled = 0
+        self._cached_prefixes = set()
+
+    def _draw(self):
+        with self._lock:
+            self.calls += 1
+            throttled = self._random.random() < self.throttle_rate
+            if throttled:
+                self.throttled += 1
+            latency = self.latency_ms * math.exp(self._random.gauss(0, self.latency_sigma)) / 1000
+        return throttled, latency
+
+    def _maybe_throttle(self, throttled, operation):
+        if throttled:
+            time.sleep(self.throttle_latency_ms / 1000)
+            raise ClientError({'Error': {'Code': 'ThrottlingException', 'Message': 'Rate exceeded'}}, operation)
+
+    def _usage(self, body):
+        request = json.loads(body)
+        prompt = request['messages'][0]['content'][0]['text']
+        system = request.get('system', [])
+        prefix = ''.join(block.get('text', '') for block in system)
+        usage = {'inputTokens': len(prompt) // 4 + 1, 'outputTokens': self.output_tokens}
+        if system and 'cachePoint' in system[-1]:
+            with self._lock:
+                seen = prefix in self._cached_prefixes
+                self._cached_prefixes.add(prefix)
+            usage['cacheReadInputTokenCount' if seen else 'cacheWriteInputTokenCount'] = len(prefix) // 4 + 1
+        else:
+            usage['inputTokens'] += len(prefix) // 4 + 1
+        return usage
+
+    def _payload(self, body):
+        usage = self._usage(body)
+        payload = {
+            'output': {'message': {'role': 'assistant', 'content': [{'text': 'token ' * self.output_tokens}]}},
+            'stopReason': 'end_turn',
+            'usage': dict(usage, totalTokens=sum(usage.values())),
+        }
+        return json.dumps(payload).encode('utf-8')
+
+    def invoke_model(self, modelId, body, **kwargs):
+        throttled, latency = self._draw()
+        self._maybe_throttle(throttled, 'InvokeModel')
+        time.sleep(latency)
+        return {'body': io.BytesIO(self._payload(body))}
+
+    def invoke_model_with_response_stream(self, modelId, body, **kwargs):
+        throttled, latency = self._draw()
+        self._maybe_throttle(throttled, 'InvokeModelWithResponseStream')
+        return {'body': _FakeStream(self, latency, self._usage(body))}
+
+
+class _FakeStream:
+    def __init__(self, backend, latency, usage):
+        self.backend = backend
+        self.latency = latency
+        self.usage = usage
+        self.closed = False
+
+    @staticmethod
+    def _event(payload):
+        return {'chunk': {'bytes': json.dumps(payload).encode('utf-8')}}
+
+    def __iter__(self):
+        backend = self.backend
+        chunks = max(1, math.ceil(backend.output_tokens / backend.tokens_per_chunk))
+        time.sleep(self.latency * backend.ttft_fraction)
+        interval = self.latency * (1 - backend.ttft_fraction) / chunks
+        yield self._event({'messageStart': {'role': 'assistant'}})
+        for i in range(chunks):
+            if self.closed:
+                return
+            if i:
+                time.sleep(interval)
+            yield self._event({'contentBlockDelta': {'delta': {'text': 'token ' * backend.tokens_per_chunk},
+                                                     'contentBlockIndex': 0}})
+        yield self._event({'messageStop': {'stopReason': 'end_turn'}})
+        yield self._event({'metadata': {'usage': dict(self.usage, totalTokens=sum(self.usage.values()))}})
+
+    def close(self):
+        self.closed = True
+
+
+class AsyncFakeBedrock(FakeBedrock):
+    """FakeBedrock for the async path: same latency model, waits with asyncio.sleep"""
+
+    async def _maybe_throttle_async(self, throttled, operation):
+        if throttled:
+            await asyncio.sleep(self.throttle_latency_ms / 1000)
+            raise ClientError({'Error': {'Code': 'ThrottlingException', 'Message': 'Rate exceeded'}}, operation)
+
+    async def invoke_model(self, modelId, body, **kwargs):
+        throttled, latency = self._draw()
+        await self._maybe_throttle_async(throttled, 'InvokeModel')
+        await asyncio.sleep(latency)
+        return {'body': _AsyncBody(self._payload(body))}
+
+    async def invoke_model_with_response_stream(self, modelId, body, **kwargs):
+        throttled, latency = self._draw()
+        await self._maybe_throttle_async(throttled, 'InvokeModelWithResponseStream')
+        return {'body': _AsyncFakeStream(self, latency, self._usage(body))}
+
+
+class _AsyncBody:
+    def __init__(self, data):
+        self.data = data
+
+    async def read(self):
+        return self.data
+
+
+class _AsyncFakeStream(_FakeStream):
+    def __aiter__(self):
+        return self._events()
+
+    async def _events(self):
+        backend = self.backend
+        chunks = max(1, math.ceil(backend.output_tokens / backend.tokens_per_chunk))
+        await asyncio.sleep(self.latency * backend.ttft_fraction)
+        interval = self.latency * (1 - backend.ttft_fraction) / chunks
+        yield self._event({'messageStart': {'role': 'assistant'}})
+        for i in range(chunks):
+            if self.closed:
+                return
+            if i:
+                await asyncio.sleep(interval)
+            yield self._event({'contentBlockDelta': {'delta': {'text': 'token ' * backend.tokens_per_chunk},
+                                                     'contentBlockIndex': 0}})
+        yield self._event({'messageStop': {'stopReason': 'end_turn'}})
+        yield self._event({'metadata': {'usage': dict(self.usage, totalTokens=sum(self.usage.values()))}})
+
+
+class _FakeBatchWriter:
+    def __init__(self, table):
+        self.table = table
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def put_item(self, Item):
+        self.table.put_item(Item=Item)
+
+
+class FakeTable:
+    """In-memory UserBenefitsContext with a fixed per-call latency"""
+
+    _SET_RE = re.compile(r"(#\w+)\s*=\s*(:\w+)")
+
+    def __init__(self, latency_ms=5):
+        self.latency_ms = latency_ms
+        self._items = {}
+        self._lock = threading.Lock()
+        self.calls = Counter()
+
+    def _call(self, operation):
+        self.calls[operation] += 1
+        time.sleep(self.latency_ms / 1000)
+
+    def load(self):
+        self._call('DescribeTable')
+
+    def get_item(self, Key):
+        self._call('GetItem')
+        with self._lock:
+            item = self._items.get(Key['employee_number'])
+            return {'Item': copy.deepcopy(item)} if item is not None else {}
+
+    def put_item(self, Item):
+        self._call('PutItem')
+        with self._lock:
+            self._items[Item['employee_number']] = copy.deepcopy(Item)
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeNames, ExpressionAttributeValues):
+        self._call('UpdateItem')
+        with self._lock:
+            item = self._items.setdefault(Key['employee_number'], dict(Key))
+            for name, value in self._SET_RE.findall(UpdateExpression):
+                item[ExpressionAttributeNames[name]] = copy.deepcopy(ExpressionAttributeValues[value])
+
+    def scan(self, Segment=0, TotalSegments=1, **kwargs):
+        self._call('Scan')
+        with self._lock:
+            items = [copy.deepcopy(item) for key, item in sorted(self._items.items())
+                     if zlib.crc32(key.encode('utf-8')) % TotalSegments == Segment]
+        return {'Items': items}
+
+    def batch_writer(self, **kwargs):
+        return _FakeBatchWriter(self)
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies):
+    values = sorted(latencies)
+    if not values:
+        return None
+    return {
+        'p50': round(percentile(values, 50) * 1000, 2),
+        'p95': round(percentile(values, 95) * 1000, 2),
+        'p99': round(percentile(values, 99) * 1000, 2),
+        'mean': round(sum(values) / len(values) * 1000, 2),
+        'max': round(values[-1] * 1000, 2),
+    }
+
+
+def make_questions(count, pool_size, unique_ratio, seed):
+    """Questions drawn from a fixed pool, with a `unique_ratio` share never seen before (cache misses)"""
+    rng = random.Random(seed)
+    pool = [f"What should I know about {TOPICS[i % len(TOPICS)]} (case {i})?" for i in range(pool_size)]
+    return [f"What should I know about {rng.choice(TOPICS)} (unique {i})?" if rng.random() < unique_ratio
+            else rng.choice(pool) for i in range(count)]
+
+
+def run_load(task, count, mode, concurrency, rate, seed):
+    """Run task(i) `count` times; return (latencies, outcomes, elapsed seconds)"""
+    latencies = [None] * count
+    outcomes = [None] * count
+
+    def timed(i, started):
+        try:
+            outcomes[i] = task(i)
+        except Exception as e:
+            outcomes[i] = f"error:{type(e).__name__}"
+        latencies[i] = time.perf_counter() - started
+
+    began = time.perf_counter()
+    if mode == 'closed':
+        next_index = iter(range(count))
+        lock = threading.Lock()
+
+        def worker():
+            while True:
+                with lock:
+                    i = next(next_index, None)
+                if i is None:
+                    return
+                timed(i, time.perf_counter())
+
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    else:
+        rng = random.Random(seed)
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            scheduled = began
+            for i in range(count):
+                scheduled += rng.expovariate(rate)
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                # Latency counts from the scheduled arrival, including time spent waiting for a worker
+                pool.submit(timed, i, scheduled)
+    return latencies, outcomes, time.perf_counter() - began
+
+
+async def run_load_async(task, count, mode, concurrency, rate, seed):
+    """run_load for coroutine tasks, all on one event loop"""
+    latencies = [None] * count
+    outcomes = [None] * count
+
+    async def timed(i, started):
+        try:
+            outcomes[i] = await task(i)
+        except Exception as e:
+            outcomes[i] = f"error:{type(e).__name__}"
+        latencies[i] = time.perf_counter() - started
+
+    began = time.perf_counter()
+    if mode == 'closed':
+        next_index = iter(range(count))
+
+        async def worker():
+            for i in next_index:
+                await timed(i, time.perf_counter())
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    else:
+        rng = random.Random(seed)
+        slots = asyncio.Semaphore(concurrency)
+
+        async def limited(i, scheduled):
+            async with slots:
+                await timed(i, scheduled)
+
+        tasks = []
+        scheduled = began
+        for i in range(count):
+            scheduled += rng.expovariate(rate)
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.ensure_future(limited(i, scheduled)))
+        await asyncio.gather(*tasks)
+    return latencies, outcomes, time.perf_counter() - began
+
+
+async def call_asgi(app, method, path, body, headers, on_chunk=None, client='127.0.0.1'):
+    """Send one request straight to an ASGI app; return the status code"""
+    received = False
+
+    async def receive():
+        nonlocal received
+        if received:
+            # Stays connected until the response is done
+            await asyncio.Event().wait()
+        received = True
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    status = None
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+        elif message.get('body') and on_chunk:
+            on_chunk(message['body'])
+
+    scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'scheme': 'http',
+             'method': method, 'path': path, 'raw_path': path.encode(), 'root_path': '', 'query_string': b'',
+             'client': (client, 0), 'server': ('127.0.0.1', 5000),
+             'headers': [(name.lower().encode(), value.encode()) for name, value in headers.items()]}
+    await app(scope, receive, send)
+    return status
+
+
+def run_scenario(name, args):
+    import bedrock_client
+    from profile_store import ProfileStore
+
+    backend = FakeBedrock(args.latency_ms, args.latency_sigma, args.throttle_rate, args.throttle_latency_ms,
+                          args.output_tokens, args.tokens_per_chunk, args.ttft_fraction, args.seed)
+    bedrock_client.bedrock_clients.set_client(backend)
+    if name.startswith('asgi'):
+        backend = AsyncFakeBedrock(args.latency_ms, args.latency_sigma, args.throttle_rate, args.throttle_latency_ms,
+                                   args.output_tokens, args.tokens_per_chunk, args.ttft_fraction, args.seed)
+        bedrock_client.async_bedrock_clients.set_client(backend)
+    questions = make_questions(args.requests, args.question_pool, args.unique_ratio, args.seed)
+    ttfb = [None] * args.requests
+    extra = {}
+
+    def client_address(i):
+        # One address per simulated employee, so per-address limits spread the same way
+        employee = i % args.employees
+        return f"10.{employee >> 16 & 255}.{employee >> 8 & 255}.{employee & 255}"
+
+    if name == 'advice':
+        def task(i):
+            answer = bedrock_client.get_financial_advice(questions[i], request_class=args.request_class)
+            return 'fallback' if answer == bedrock_client.FALLBACK_RESPONSE else 'ok'
+
+    elif name == 'stream':
+        def task(i):
+            started = time.perf_counter()
+            for text in bedrock_client.stream_financial_advice(questions[i], request_class=args.request_class):
+                if ttfb[i] is None:
+                    ttfb[i] = time.perf_counter() - started
+                if text == bedrock_client.FALLBACK_RESPONSE:
+                    return 'fallback'
+            return 'ok'
+
+    elif name in ('api', 'api_stream'):
+        import api
+        clients = threading.local()
+        path = '/api/advice' if name == 'api' else '/api/advice/stream'
+
+        def task(i):
+            if not hasattr(clients, 'client'):
+                clients.client = api.app.test_client()
+            started = time.perf_counter()
+            response = clients.client.post(
+                path,
+                json={'question': questions[i], 'request_class': args.request_class},
+                # Spread requests over many employees and addresses so rate limits do not dominate
+                headers={'X-Employee-Number': f"E{i % args.employees:05d}"},
+                environ_base={'REMOTE_ADDR': client_address(i)},
+                buffered=False,
+            )
+            try:
+                for _ in response.response:
+                    if ttfb[i] is None:
+                        ttfb[i] = time.perf_counter() - started
+            finally:
+                response.close()
+            return str(response.status_code)
+
+    elif name in ('asgi', 'asgi_stream'):
+        import asgi_api
+        path = '/api/advice' if name == 'asgi' else '/api/advice/stream'
+
+        async def task(i):
+            started = time.perf_counter()
+
+            def on_chunk(chunk):
+                if ttfb[i] is None:
+                    ttfb[i] = time.perf_counter() - started
+
+            body = json.dumps({'question': questions[i], 'request_class': args.request_class}).encode()
+            headers = {'Content-Type': 'application/json', 'X-Employee-Number': f"E{i % args.employees:05d}"}
+            return str(await call_asgi(asgi_api.app, 'POST', path, body, headers, on_chunk, client_address(i)))
+
+    elif name == 'profile':
+        table = FakeTable(args.dynamodb_latency_ms)
+        store = ProfileStore(table, debounce_seconds=args.debounce_seconds)
+        rng = random.Random(args.seed)
+        operations = [(f"E{rng.randrange(args.employees):05d}", rng.random() < args.write_ratio)
+                      for _ in range(args.requests)]
+
+        def task(i):
+            employee_number, write = operations[i]
+            if write:
+                store.writer.save(employee_number, {'last_interaction': f"t{i}", 'profile': {'age': 30 + i % 40}})
+            else:
+                store.get(employee_number)
+            return 'write' if write else 'read'
+
+        def finish():
+            store.writer.flush_all()
+            extra['dynamodb_calls'] = dict(table.calls)
+            extra['profile_cache'] = store.cache.stats()
+    else:
+        raise ValueError(f"Unknown scenario: {name}")
+
+    if name.startswith('asgi'):
+        latencies, outcomes, elapsed = asyncio.run(
+            run_load_async(task, args.requests, args.mode, args.concurrency, args.rate, args.seed))
+    else:
+        latencies, outcomes, elapsed = run_load(task, args.requests, args.mode, args.concurrency, args.rate,
+                                                args.seed)
+    if name == 'profile':
+        finish()
+    else:
+        extra['bedrock_calls'] = backend.calls
+        extra['bedrock_throttled'] = backend.throttled
+        extra['advice_stats'] = bedrock_client.advice_stats()
+
+    result = {
+        'requests': args.requests,
+        'elapsed_s': round(elapsed, 3),
+        'rps': round(args.requests / elapsed, 2),
+        'outcomes': dict(Counter(outcomes)),
+        'latency_ms': summarize([l for l in latencies if l is not None]),
+    }
+    if any(t is not None for t in ttfb):
+        result['ttfb_ms'] = summarize([t for t in ttfb if t is not None])
+    result.update(extra)
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, current):
+    for name, result in current['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(name)
+        if not before:
+            continue
+        print(f"{name}:")
+        rows = [('rps', before['rps'], result['rps'])]
+        for pct in ('p50', 'p95', 'p99'):
+            if before.get('latency_ms') and result.get('latency_ms'):
+                rows.append((f"{pct} ms", before['latency_ms'][pct], result['latency_ms'][pct]))
+        for label, old, new in rows:
+            change = f"{(new - old) / old * 100:+.1f}%" if old else 'n/a'
+            print(f"  {label:8} {old:>10} -> {new:>10}  ({change})")
+
+
+def _child_argv(argv):
+    """The command line minus the options only the parent process uses"""
+    dropped = ('--output', '--compare', '--scenario')
+    child = []
+    skip = False
+    for arg in argv:
+        if skip:
+            skip = False
+        elif arg in dropped:
+            skip = True
+        elif not arg.startswith(tuple(f"{option}=" for option in dropped)):
+            child.append(arg)
+    return child
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scenario', choices=SCENARIOS + ['all'], default='all')
+    parser.add_argument('--mode', choices=['closed', 'open'], default='closed')
+    parser.add_argument('--requests', type=int, default=500, help="requests per scenario")
+    parser.add_argument('--concurrency', type=int, default=16,
+                        help="closed loop: concurrent clients; open loop: max outstanding requests")
+    parser.add_argument('--rate', type=float, default=50.0, help="open loop: arrivals per second")
+    parser.add_argument('--request-class', default='quick')
+    parser.add_argument('--question-pool', type=int, default=50, help="distinct repeated questions")
+    parser.add_argument('--unique-ratio', type=float, default=0.2, help="share of never-repeated questions")
+    parser.add_argument('--employees', type=int, default=1000)
+    parser.add_argument('--latency-ms', type=float, default=400.0, help="median fake Bedrock latency")
+    parser.add_argument('--latency-sigma', type=float, default=0.5, help="lognormal spread of that latency")
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    parser.add_argument('--throttle-latency-ms', type=float, default=20.0)
+    parser.add_argument('--output-tokens', type=int, default=300)
+    parser.add_argument('--tokens-per-chunk', type=int, default=20)
+    parser.add_argument('--ttft-fraction', type=float, default=0.3)
+    parser.add_argument('--dynamodb-latency-ms', type=float, default=5.0)
+    parser.add_argument('--write-ratio', type=float, default=0.2, help="profile scenario: share of saves")
+    parser.add_argument('--debounce-seconds', type=float, default=0.05)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="write results JSON here")
+    parser.add_argument('--compare', help="earlier results JSON to compare against")
+    parser.add_argument('--single', action='store_true', help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    args = parse_args(argv)
+
+    if args.single:
+        # Child process: run one scenario and hand the result back on stdout
+        print(json.dumps(run_scenario(args.scenario, args)))
+        return 0
+
+    names = SCENARIOS if args.scenario == 'all' else [args.scenario]
+    base_argv = _child_argv(argv)
+    scenarios = {}
+    for name in names:
+        print(f"Running {name} ({args.mode} loop, {args.requests} requests)...", file=sys.stderr)
+        child = subprocess.run([sys.executable, __file__, '--single', '--scenario', name] + base_argv,
+                               capture_output=True, text=True)
+        if child.returncode != 0:
+            print(child.stderr, file=sys.stderr)
+            return 1
+        # The pipeline prints warnings on stdout; the result is the last line
+        scenarios[name] = json.loads(child.stdout.strip().splitlines()[-1])
+
+    results = {
+        'commit': git_commit(),
+        'created_at': datetime.datetime.now().isoformat(),
+        'config': {k: v for k, v in vars(args).items() if k not in ('output', 'compare', 'single', 'scenario')},
+        'scenarios': scenarios,
+    }
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
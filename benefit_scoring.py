@@ -0,0 +1,144 @@
+"""Rules-based benefit ranking, scored for many profiles at once with NumPy.
+
+Each profile is turned into a row of binary/count features; the score of
+every benefit is that row times the BENEFIT_RULES weights, clipped to
+0-100. Feature thresholds sit on the profile_buckets band edges, so every
+profile in a bucket gets the same ranking.
+"""
+import numpy as np
+
+BENEFITS = ["Health Insurance", "Dental", "Vision", "Employee Assistance Program",
+            "Caregiver Resources", "Tutoring Support"]
+
+FEATURES = [
+    'base',
+    'age_under_26', 'age_45_plus', 'age_65_plus',
+    'income_under_50k', 'income_100k_plus',
+    'married', 'children', 'single_parent', 'dependents',
+    'preventive_care', 'chronic_conditions', 'mental_health', 'dental', 'vision',
+    'goal_save', 'goal_comprehensive', 'goal_balance',
+]
+
+# Points each feature adds to a benefit's score; unlisted features count 0
+BENEFIT_RULES = {
+    "Health Insurance": {
+        'base': 70, 'chronic_conditions': 20, 'preventive_care': 5, 'dependents': 3, 'age_45_plus': 5,
+        'goal_comprehensive': 10, 'goal_save': -5,
+    },
+    "Dental": {
+        'base': 40, 'dental': 35, 'children': 10, 'dependents': 3, 'preventive_care': 5,
+        'goal_comprehensive': 5, 'goal_save': -5,
+    },
+    "Vision": {
+        'base': 35, 'vision': 35, 'age_45_plus': 10, 'children': 5, 'dependents': 2,
+        'goal_comprehensive': 5, 'goal_save': -5,
+    },
+    "Employee Assistance Program": {
+        'base': 35, 'mental_health': 35, 'chronic_conditions': 5, 'single_parent': 10, 'income_under_50k': 5,
+    },
+    "Caregiver Resources": {
+        'base': 20, 'children': 15, 'single_parent': 15, 'dependents': 8, 'age_45_plus': 10, 'age_65_plus': 5,
+    },
+    "Tutoring Support": {
+        'base': 10, 'children': 30, 'dependents': 8, 'single_parent': 5, 'income_under_50k': 5,
+        'age_under_26': -5,
+    },
+}
+
+HEALTH_CONCERN_FEATURES = {
+    "Preventive care": 'preventive_care',
+    "Chronic conditions": 'chronic_conditions',
+    "Mental health": 'mental_health',
+    "Dental": 'dental',
+    "Vision": 'vision',
+}
+GOAL_FEATURES = {
+    "Save money": 'goal_save',
+    "Comprehensive coverage": 'goal_comprehensive',
+    "Balance cost and coverage": 'goal_balance',
+}
+MAX_DEPENDENTS = 3
+
+
+def _weight_matrix():
+    weights = np.zeros((len(FEATURES), len(BENEFITS)), dtype=np.float32)
+    for column, benefit in enumerate(BENEFITS):
+        for feature, points in BENEFIT_RULES[benefit].items():
+            weights[FEATURES.index(feature), column] = points
+    return weights
+
+
+WEIGHTS = _weight_matrix()
+
+
+def profile_features(profiles):
+    """Feature matrix (len(profiles) x len(FEATURES)) for `profile` maps as stored in UserBenefitsContext"""
+    age = np.array([int(p.get('age', 30)) for p in profiles], dtype=np.int32)
+    income = np.array([int(p.get('income', 50000)) for p in profiles], dtype=np.int64)
+    family = np.array([p.get('family_status', 'Single') for p in profiles], dtype=object)
+    dependents = np.array([int(p.get('dependents', 0)) for p in profiles], dtype=np.int32)
+
+    features = np.zeros((len(profiles), len(FEATURES)), dtype=np.float32)
+    column = {name: i for i, name in enumerate(FEATURES)}
+    features[:, column['base']] = 1
+    features[:, column['age_under_26']] = age < 26
+    features[:, column['age_45_plus']] = age >= 45
+    features[:, column['age_65_plus']] = age >= 65
+    features[:, column['income_under_50k']] = income < 50000
+    features[:, column['income_100k_plus']] = income >= 100000
+    features[:, column['married']] = np.isin(family, ["Married", "Married with children"])
+    features[:, column['children']] = np.isin(family, ["Married with children", "Single parent"]) | (dependents > 0)
+    features[:, column['single_parent']] = family == "Single parent"
+    features[:, column['dependents']] = np.minimum(dependents, MAX_DEPENDENTS)
+    for row, profile in enumerate(profiles):
+        for concern in profile.get('health_concerns') or ():
+            if concern in HEALTH_CONCERN_FEATURES:
+                features[row, column[HEALTH_CONCERN_FEATURES[concern]]] = 1
+        goal = GOAL_FEATURES.get(profile.get('financial_goals'))
+        if goal:
+            features[row, column[goal]] = 1
+    return features
+
+
+def score_profiles(profiles):
+    """Scores (len(profiles) x len(BENEFITS)), each 0-100"""
+    return np.clip(profile_features(profiles) @ WEIGHTS, 0, 100)
+
+
+def rank_roster(profiles, benefit_types=None):
+    """Rank benefits for every profile in one pass.
+
+    Returns one [(benefit, score), ...] list per profile, best first. Only the
+    benefits in `benefit_types` (or each profile's own `benefit_types`, or
+    all of them) are included.
+    """
+    if not profiles:
+        return []
+    scores = score_profiles(profiles)
+    selected = np.ones(scores.shape, dtype=bool)
+    for row, profile in enumerate(profiles):
+        wanted = benefit_types or profile.get('benefit_types')
+        if wanted:
+            selected[row] = np.isin(BENEFITS, list(wanted))
+    masked = np.where(selected, scores, -1)
+    # Stable sort keeps BENEFITS order for ties, so rankings are deterministic
+    order = np.argsort(-masked, axis=1, kind='stable')
+    counts = selected.sum(axis=1)
+    return [
+        [(BENEFITS[i], int(round(scores[row, i]))) for i in order[row, :counts[row]]]
+        for row in range(len(profiles))
+    ]
+
+
+def rank_benefits(profile, benefit_types=None):
+    return rank_roster([profile], benefit_types)[0]
+
+
+def ranking_to_item(ranking):
+    """Store a ranking in a DynamoDB item as a list of maps"""
+    return [{'benefit': benefit, 'score': score} for benefit, score in ranking]
+
+
+def ranking_from_item(stored):
+    # DynamoDB hands numbers back as Decimal
+    return [(entry['benefit'], int(entry['score'])) for entry in stored or []] or None
@@ -0,0 +1,83 @@
+"""Bounded follow-up history for one employee.
+
+The last `max_turns` question/answer pairs are kept verbatim (each clipped
+to `max_turn_tokens`). Older turns are folded into a rolling summary of one
+line per turn, and the oldest lines are dropped once the summary exceeds
+`summary_tokens`. The prompt built from it therefore has a fixed upper
+size however long the conversation runs.
+"""
+import os
+import re
+
+CONVERSATION_MAX_TURNS = int(os.environ.get('CONVERSATION_MAX_TURNS', '4'))
+CONVERSATION_TURN_TOKENS = int(os.environ.get('CONVERSATION_TURN_TOKENS', '300'))
+CONVERSATION_SUMMARY_TOKENS = int(os.environ.get('CONVERSATION_SUMMARY_TOKENS', '400'))
+
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s")
+
+
+def estimate_tokens(text):
+    # Roughly four characters per token for English text
+    return len(text) // 4 + 1
+
+
+def clip(text, max_tokens):
+    text = ' '.join(text.split())
+    max_chars = max_tokens * 4
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars].rsplit(' ', 1)[0] + '…'
+
+
+def first_sentence(text):
+    return _SENTENCE_END_RE.split(' '.join(text.split()), 1)[0]
+
+
+class ConversationMemory:
+    def __init__(self, summary='', turns=None, max_turns=CONVERSATION_MAX_TURNS,
+                 max_turn_tokens=CONVERSATION_TURN_TOKENS, summary_tokens=CONVERSATION_SUMMARY_TOKENS):
+        self.summary = summary
+        self.turns = list(turns or [])
+        self.max_turns = max_turns
+        self.max_turn_tokens = max_turn_tokens
+        self.summary_tokens = summary_tokens
+
+    @classmethod
+    def from_item(cls, stored, **limits):
+        """Rebuild from the `conversation` attribute of a UserBenefitsContext item"""
+        stored = stored or {}
+        turns = [(turn['q'], turn['a']) for turn in stored.get('turns', [])]
+        return cls(stored.get('summary', ''), turns, **limits)
+
+    def to_item(self):
+        return {'summary': self.summary, 'turns': [{'q': q, 'a': a} for q, a in self.turns]}
+
+    def add_turn(self, question, answer):
+        self.turns.append((clip(question, self.max_turn_tokens), clip(answer, self.max_turn_tokens)))
+        while len(self.turns) > self.max_turns:
+            self._fold(*self.turns.pop(0))
+
+    def _fold(self, question, answer):
+        line = f"- Asked: {clip(question, 30)} Told: {clip(first_sentence(answer), 50)}"
+        lines = [l for l in self.summary.splitlines() if l] + [line]
+        while len(lines) > 1 and estimate_tokens('\n'.join(lines)) > self.summary_tokens:
+            lines.pop(0)
+        self.summary = '\n'.join(lines)
+
+    def build_prompt(self, question, profile=None):
+        """Wrap a question (or a prompt built around it) with the profile and conversation so far"""
+        sections = []
+        if profile:
+            sections.append(f"Employee profile: {profile}")
+        if self.summary:
+            sections.append(f"Earlier in this conversation:\n{self.summary}")
+        if self.turns:
+            recent = '\n'.join(f"Q: {q}\nA: {a}" for q, a in self.turns)
+            sections.append(f"Most recent exchanges:\n{recent}")
+        if not sections:
+            return question
+        return '\n\n'.join(sections) + f"\n\nAnswer the new question in light of the above.\n{question}"
+
+    def clear(self):
+        self.summary = ''
+        self.turns = []
@@ -2,23 +2,30 @@ import boto3
 
 dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
 
-try:
-    table = dynamodb.create_table(
-        TableName='UserBenefitsContext',
-        KeySchema=[
-            {'AttributeName': 'employee_number', 'KeyType': 'HASH'}
-        ],
-        AttributeDefinitions=[
-            {'AttributeName': 'employee_number', 'AttributeType': 'S'}
-        ],
-        BillingMode='PAY_PER_REQUEST'
-    )
-    
-    print("Creating table...")
-    table.wait_until_exists()
-    print("✅ Table created successfully!")
-    print(f"Table status: {table.table_status}")
-    
-except Exception as e:
-    print(f"Error: {e}")
-    print("Table may already exist or check your AWS permissions.")
\ No newline at end of file
+# Employee profiles, and the recommendation fragments they point to (shared between employees)
+TABLES = {
+    'UserBenefitsContext': 'employee_number',
+    'RecommendationFragments': 'fragment_id',
+}
+
+for table_name, key in TABLES.items():
+    try:
+        table = dynamodb.create_table(
+            TableName=table_name,
+            KeySchema=[
+                {'AttributeName': key, 'KeyType': 'HASH'}
+            ],
+            AttributeDefinitions=[
+                {'AttributeName': key, 'AttributeType': 'S'}
+            ],
+            BillingMode='PAY_PER_REQUEST'
+        )
+
+        print(f"Creating table {table_name}...")
+        table.wait_until_exists()
+        print("✅ Table created successfully!")
+        print(f"Table status: {table.table_status}")
+
+    except Exception as e:
+        print(f"Error: {e}")
+        print(f"Table {table_name} may already exist or check your AWS permissions.")
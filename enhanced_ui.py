@@ -1,12 +1,180 @@
 import streamlit as st
 import boto3
 import datetime
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import timedelta
-from bedrock_client import get_financial_advice
+from bedrock_client import (get_financial_advice, get_structured_recommendations, stream_financial_advice,
+                            warm_up_bedrock)
+from profile_buckets import (canonicalize_profile, describe_bucket, explanation_question, comparison_question,
+                             benefit_section_question)
+from conversation_memory import ConversationMemory
+from benefit_scoring import rank_benefits, ranking_from_item, ranking_to_item
+from profile_store import ProfileStore
+from recommendations import FragmentStore, fragment_markdown, fragments_from_item, fragments_to_item
+from knowledge_base import ground_question
+import metrics
 
 # DynamoDB setup
-dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
-table = dynamodb.Table('UserBenefitsContext')
+@st.cache_resource
+def get_profile_store():
+    # Built once per process so the boto3 resource, read cache and pending writes survive reruns
+    dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+    return ProfileStore(dynamodb.Table('UserBenefitsContext'))
+
+
+@st.cache_resource
+def get_fragment_store():
+    dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+    return FragmentStore(dynamodb.Table('RecommendationFragments'))
+
+
+FANOUT_MAX_CONCURRENCY = int(os.environ.get('UI_FANOUT_MAX_CONCURRENCY', '6'))
+
+
+@st.cache_resource
+def get_fanout_executor():
+    # One pool per process, shared by every session; Bedrock concurrency is still capped by its limiter
+    return ThreadPoolExecutor(max_workers=FANOUT_MAX_CONCURRENCY, thread_name_prefix='ui-fanout')
+
+
+profile_store = get_profile_store()
+profile_writer = profile_store.writer
+fragment_store = get_fragment_store()
+
+# Shared Bedrock client survives Streamlit reruns; only the first run pays setup
+warm_up_bedrock()
+
+
+def stream_advice(question, request_class='quick'):
+    """Render the answer as it streams in, then clear it so the normal results section shows it.
+
+    Returns None if the stream broke part-way.
+    """
+    placeholder = st.empty()
+    try:
+        with placeholder.container():
+            text = st.write_stream(stream_financial_advice(question, request_class=request_class))
+    except Exception as e:
+        # Broke part-way; show nothing rather than an answer that stops mid-sentence
+        placeholder.empty()
+        st.error(f"The answer was cut off ({e}). Please try again.")
+        return None
+    placeholder.empty()
+    return text
+
+
+def render_section(position, benefit, score, fragment):
+    if fragment is None:
+        st.markdown(f"#### {position}. {benefit} — fit score {score}/100\n\n"
+                    "_This section could not be generated right now. Please try again shortly._")
+    else:
+        st.markdown(fragment_markdown(benefit, fragment, position, score))
+
+
+def render_recommendations(ranking, fragments):
+    """Render stored fragments in ranking order; older items without a ranking keep fragment order"""
+    ranking = ranking or [(benefit, None) for benefit in fragments]
+    for position, (benefit, score) in enumerate(ranking, 1):
+        if benefit in fragments:
+            st.markdown(fragment_markdown(benefit, fragments[benefit], position, score))
+
+
+def generate_sections(bucket, ranking, comparison=None):
+    """Request every benefit's section, and the comparison if given, at once.
+
+    Each is shown as soon as it completes, then cleared so the normal results
+    section shows them. Sections are cached per benefit by bedrock_client,
+    so changing the selection only generates the sections that changed.
+    Returns ({benefit: fragment} for the sections that succeeded, comparison text).
+    """
+    executor = get_fanout_executor()
+    placeholder = st.empty()
+    futures = {}
+    with placeholder.container():
+        slots = {}
+        for position, (benefit, score) in enumerate(ranking, 1):
+            slots[benefit] = st.empty()
+            slots[benefit].info(f"⏳ {position}. {benefit} — generating...")
+            question = benefit_section_question(bucket, benefit)
+            futures[executor.submit(get_structured_recommendations, question, [benefit])] = benefit
+        if comparison:
+            slots[None] = st.empty()
+            slots[None].info("⏳ Benefits comparison — generating...")
+            futures[executor.submit(get_financial_advice, comparison, True, 'comparison')] = None
+
+        positions = {benefit: (position, score) for position, (benefit, score) in enumerate(ranking, 1)}
+        fragments = {}
+        comparison_text = None
+        for future in as_completed(futures):
+            benefit = futures[future]
+            if benefit is None:
+                comparison_text = future.result()
+                slots[None].markdown(f"#### ⚖️ Benefits Comparison\n\n{comparison_text}")
+            else:
+                position, score = positions[benefit]
+                result = future.result()
+                if result:
+                    fragments.update(result)
+                with slots[benefit].container():
+                    render_section(position, benefit, score, (result or {}).get(benefit))
+    placeholder.empty()
+    return {benefit: fragments[benefit] for benefit, _ in ranking if benefit in fragments}, comparison_text
+
+
+def store_fragments(fragments):
+    """Save fragments to RecommendationFragments; return {benefit: fragment_id}"""
+    try:
+        return fragment_store.save(fragments)
+    except Exception as e:
+        st.error(f"Error saving recommendations: {e}")
+        return {}
+
+
+def load_fragments(stored):
+    try:
+        return fragment_store.load(fragments_from_item(stored))
+    except Exception as e:
+        st.error(f"Error loading saved recommendations: {e}")
+        return {}
+
+
+def render_metrics_panel():
+    snapshot = metrics.summary()
+
+    def ms(seconds):
+        return '–' if seconds is None else f"{seconds * 1000:,.0f} ms"
+
+    st.markdown("**Bedrock latency**")
+    for name, row in snapshot['bedrock'].items():
+        st.caption(f"{name}: {row['count']} calls · p50 {ms(row['p50'])} · p95 {ms(row['p95'])}")
+    st.markdown("**Pipeline stages**")
+    for stage, row in snapshot['stages'].items():
+        st.caption(f"{stage}: p50 {ms(row['p50'])} · p95 {ms(row['p95'])}")
+    st.markdown("**Tokens**")
+    for model, tokens in snapshot['tokens'].items():
+        st.caption(f"{model}: {tokens.get('input', 0):,} in · {tokens.get('output', 0):,} out · "
+                   f"{tokens.get('cache_read', 0):,} cache read · {tokens.get('cache_write', 0):,} cache write")
+    if snapshot['first_token']:
+        st.markdown("**Time to first token**")
+        for name, row in snapshot['first_token'].items():
+            st.caption(f"{name}: p50 {ms(row['p50'])} · p95 {ms(row['p95'])}")
+    st.markdown("**Cache**")
+    for request_class, counts in snapshot['cache'].items():
+        st.caption(f"{request_class}: {counts['hit_rate']:.0%} hit rate "
+                   f"({counts.get('hit', 0)} hit, {counts.get('miss', 0)} miss)")
+    if snapshot['fallbacks']:
+        st.markdown("**Fallbacks**")
+        st.caption(' · '.join(f"{reason}: {count}" for reason, count in snapshot['fallbacks'].items()))
+    st.markdown("**DynamoDB**")
+    for operation, row in snapshot['dynamodb'].items():
+        st.caption(f"{operation}: {row['count']} calls · p50 {ms(row['p50'])} · p95 {ms(row['p95'])}")
+
+
+def render_ranking(ranking):
+    for position, (benefit, score) in enumerate(ranking, 1):
+        st.markdown(f"**{position}. {benefit}** — fit score {score}/100")
+        st.progress(score / 100)
 
 # Page configuration
 st.set_page_config(
@@ -79,6 +247,10 @@ with st.sidebar:
     if st.button("🔄 Reset Form"):
         st.markdown('<meta http-equiv="refresh" content="0">', unsafe_allow_html=True)
     
+    st.markdown("### ⚙️ Generation")
+    st.checkbox("⚡ Generate sections in parallel", value=True, key='fanout',
+                help="Request each benefit's section and the comparison at once, showing each as it finishes")
+
     st.markdown("### 💡 Tips")
     st.info("💰 Consider your budget and family needs when selecting benefits")
     st.info("🏥 Prioritize health coverage based on your medical history")
@@ -86,7 +258,16 @@ with st.sidebar:
 
 # Initialize session state
 if 'recommendations' not in st.session_state:
+    # Markdown saved before recommendations became structured; shown only when there are no fragments
     st.session_state.recommendations = None
+if 'fragments' not in st.session_state:
+    st.session_state.fragments = {}
+if 'fragment_ids' not in st.session_state:
+    st.session_state.fragment_ids = {}
+if 'ranking' not in st.session_state:
+    st.session_state.ranking = None
+if 'conversation' not in st.session_state:
+    st.session_state.conversation = ConversationMemory()
 if 'custom_answer' not in st.session_state:
     st.session_state.custom_answer = None
 if 'comparison' not in st.session_state:
@@ -115,17 +296,21 @@ with col_id3:
             st.error("Employee Number must be at least 5 characters.")
         else:
             try:
-                # Check if table exists first
-                table.load()
-                response = table.get_item(Key={'employee_number': employee_number})
-                if 'Item' in response:
-                    item = response['Item']
+                item = profile_store.get(employee_number)
+                if item:
                     if item.get('name') != name:
                         st.warning("Name doesn't match records—updating with new name.")
                     last_interaction = datetime.datetime.fromisoformat(item['last_interaction'])
+                    if item.get('recommendations_generated_at'):
+                        # Recommendations refreshed by precompute_recommendations.py count as recent
+                        last_interaction = max(last_interaction, datetime.datetime.fromisoformat(item['recommendations_generated_at']))
                     if datetime.datetime.now() - last_interaction <= timedelta(days=30):
                         st.session_state.loaded_profile = item.get('profile', {})
                         st.session_state.recommendations = item.get('recommendations', None)
+                        st.session_state.fragment_ids = fragments_from_item(item.get('recommendation_fragments'))
+                        st.session_state.fragments = load_fragments(item.get('recommendation_fragments'))
+                        st.session_state.ranking = ranking_from_item(item.get('benefit_ranking'))
+                        st.session_state.conversation = ConversationMemory.from_item(item.get('conversation'))
                         st.session_state.profile_loaded = True
                         st.session_state.name = name
                         st.session_state.employee_number = employee_number
@@ -160,6 +345,11 @@ if not st.session_state.profile_loaded:
     st.info("Enter your details above and click 'Load Profile' to continue.")
     st.stop()
 
+# Profile writes happen in the background; surface any failure from an earlier run
+save_error = profile_writer.take_error(st.session_state.employee_number)
+if save_error:
+    st.error(f"Error saving profile: {save_error}")
+
 # Main content area
 col_left, col_right = st.columns([2, 1])
 
@@ -194,6 +384,7 @@ with col_left:
     
     benefit_types = st.multiselect("Select benefit types to analyze:", 
         ["Health Insurance", "Dental", "Vision", "Employee Assistance Program", "Caregiver Resources", "Tutoring Support"],
+        default=st.session_state.loaded_profile.get('benefit_types', []),
         help="Choose the benefits you want recommendations for")
 
     # Custom prompt section
@@ -242,90 +433,127 @@ with col_btn3:
 # Results Section
 if get_recommendations:
     if benefit_types:
-        user_profile = f"Age: {age}, Income: ${income}, Family: {family_status}, Dependents: {dependents}, Health priorities: {health_concerns}, Goal: {financial_goals}"
-        question = f"Recommend optimal benefits for: {user_profile}. Focus on: {', '.join(benefit_types)}"
-        
-        with st.spinner("🔍 Analyzing your profile and generating recommendations..."):
-            st.session_state.recommendations = get_financial_advice(question)
-            
-            # Save to DynamoDB
-            profile_data = {
-                'age': age, 'income': income, 'family_status': family_status,
-                'dependents': dependents, 'health_concerns': health_concerns,
-                'financial_goals': financial_goals
-            }
-            item = {
-                'employee_number': st.session_state.employee_number,
-                'name': st.session_state.name,
-                'last_interaction': datetime.datetime.now().isoformat(),
-                'profile': profile_data,
-                'recommendations': st.session_state.recommendations
-            }
-            try:
-                table.put_item(Item=item)
-            except Exception as e:
-                st.error(f"Error saving profile: {e}")
-    else:
-        st.warning("⚠️ Please select at least one benefit type to get recommendations.")
-
-if ask_question and custom_prompt:
-    with st.spinner("🤔 Finding the best answer for you..."):
-        st.session_state.custom_answer = get_financial_advice(custom_prompt)
-        
-        # Update DynamoDB
         profile_data = {
             'age': age, 'income': income, 'family_status': family_status,
             'dependents': dependents, 'health_concerns': health_concerns,
-            'financial_goals': financial_goals
+            'financial_goals': financial_goals, 'benefit_types': benefit_types
         }
+        # The ranking is computed locally and shown at once; the model only explains it
+        st.session_state.ranking = rank_benefits(profile_data)
+        ranking_placeholder = st.empty()
+        with ranking_placeholder.container():
+            st.markdown("### 🏆 Your Benefit Ranking")
+            render_ranking(st.session_state.ranking)
+        bucket = canonicalize_profile(age, income, family_status, dependents, health_concerns, financial_goals, benefit_types)
+        if st.session_state.fanout:
+            comparison = comparison_question(bucket) if len(benefit_types) >= 2 else None
+            fragments, compared = generate_sections(bucket, st.session_state.ranking, comparison)
+            if compared:
+                st.session_state.comparison = compared
+        else:
+            question = explanation_question(bucket, st.session_state.ranking)
+            with st.spinner("🔍 Generating your recommendations..."):
+                fragments = get_structured_recommendations(
+                    question, [benefit for benefit, _ in st.session_state.ranking]) or {}
+        ranking_placeholder.empty()
+        if fragments:
+            st.session_state.fragments = fragments
+            st.session_state.fragment_ids = store_fragments(fragments)
+            st.session_state.recommendations = None
+        else:
+            st.error("Recommendations are unavailable right now. Please try again shortly.")
+        
+        # Save to DynamoDB
         item = {
             'employee_number': st.session_state.employee_number,
             'name': st.session_state.name,
             'last_interaction': datetime.datetime.now().isoformat(),
             'profile': profile_data,
-            'recommendations': st.session_state.recommendations
+            'recommendations': st.session_state.recommendations,
+            'recommendation_fragments': fragments_to_item(st.session_state.fragment_ids),
+            'benefit_ranking': ranking_to_item(st.session_state.ranking or []),
+            'conversation': st.session_state.conversation.to_item()
         }
-        try:
-            table.put_item(Item=item)
-        except Exception as e:
-            st.error(f"Error saving: {e}")
+        if fragments:
+            # Lets precompute_recommendations.py see these are fresh and leave them alone
+            item['recommendations_generated_at'] = datetime.datetime.now().isoformat()
+        profile_writer.save(st.session_state.employee_number, item)
+    else:
+        st.warning("⚠️ Please select at least one benefit type to get recommendations.")
+
+if ask_question and custom_prompt:
+    conversation = st.session_state.conversation
+    direct_answer, prompt = ground_question(custom_prompt)
+    if direct_answer:
+        st.session_state.custom_answer = direct_answer
+    else:
+        bucket = canonicalize_profile(age, income, family_status, dependents, health_concerns, financial_goals, benefit_types)
+        prompt = conversation.build_prompt(prompt, describe_bucket(bucket))
+        st.session_state.custom_answer = stream_advice(prompt)
+    if st.session_state.custom_answer is not None:
+        conversation.add_turn(custom_prompt, st.session_state.custom_answer)
+    
+    # Update DynamoDB
+    profile_data = {
+        'age': age, 'income': income, 'family_status': family_status,
+        'dependents': dependents, 'health_concerns': health_concerns,
+        'financial_goals': financial_goals, 'benefit_types': benefit_types
+    }
+    item = {
+        'employee_number': st.session_state.employee_number,
+        'name': st.session_state.name,
+        'last_interaction': datetime.datetime.now().isoformat(),
+        'profile': profile_data,
+        'recommendations': st.session_state.recommendations,
+        'recommendation_fragments': fragments_to_item(st.session_state.fragment_ids),
+        'benefit_ranking': ranking_to_item(st.session_state.ranking or []),
+        'conversation': st.session_state.conversation.to_item()
+    }
+    profile_writer.save(st.session_state.employee_number, item)
 
 if compare_benefits:
     if len(benefit_types) >= 2:
-        comparison_question = f"Compare and contrast these benefits for someone with profile: Age {age}, Income ${income}, Family status: {family_status}. Benefits to compare: {', '.join(benefit_types)}"
+        bucket = canonicalize_profile(age, income, family_status, dependents, health_concerns, financial_goals, benefit_types)
+        comparison = comparison_question(bucket)
         
-        with st.spinner("⚖️ Comparing your selected benefits..."):
-            st.session_state.comparison = get_financial_advice(comparison_question)
+        st.session_state.comparison = stream_advice(comparison, 'comparison')
     else:
         st.warning("⚠️ Please select at least 2 benefit types to compare.")
 
 # Display results from session state
-if st.session_state.recommendations:
+if st.session_state.fragments or st.session_state.recommendations:
     st.markdown("""
     <div class="recommendation-box">
         <h2>🎯 Your Personalized Recommendations</h2>
     </div>
     """, unsafe_allow_html=True)
-    st.markdown(st.session_state.recommendations)
+    if st.session_state.fragments:
+        render_recommendations(st.session_state.ranking, st.session_state.fragments)
+    else:
+        if st.session_state.ranking:
+            render_ranking(st.session_state.ranking)
+        st.markdown(st.session_state.recommendations)
     
     if st.button("💾 Save Recommendations"):
         profile_data = {
             'age': age, 'income': income, 'family_status': family_status,
             'dependents': dependents, 'health_concerns': health_concerns,
-            'financial_goals': financial_goals
+            'financial_goals': financial_goals, 'benefit_types': benefit_types
         }
         item = {
             'employee_number': st.session_state.employee_number,
             'name': st.session_state.name,
             'last_interaction': datetime.datetime.now().isoformat(),
             'profile': profile_data,
-            'recommendations': st.session_state.recommendations
+            'recommendations': st.session_state.recommendations,
+            'recommendation_fragments': fragments_to_item(st.session_state.fragment_ids),
+            'benefit_ranking': ranking_to_item(st.session_state.ranking or []),
+            'conversation': st.session_state.conversation.to_item()
         }
-        try:
-            table.put_item(Item=item)
+        if profile_writer.save(st.session_state.employee_number, item, flush=True):
             st.success("✅ Recommendations saved to your profile!")
-        except Exception as e:
-            st.error(f"Error saving: {e}")
+        else:
+            st.error(f"Error saving: {profile_writer.take_error(st.session_state.employee_number)}")
 
 if st.session_state.custom_answer:
     st.markdown('<div class="section-header"><h2>💡 Answer</h2></div>', unsafe_allow_html=True)
@@ -342,6 +570,11 @@ if st.session_state.comparison:
     st.markdown('<div class="section-header"><h2>⚖️ Benefits Comparison</h2></div>', unsafe_allow_html=True)
     st.markdown(st.session_state.comparison)
 
+# Rendered last so the numbers include this run's calls
+with st.sidebar:
+    with st.expander("📈 Admin: Pipeline Metrics"):
+        render_metrics_panel()
+
 # Footer
 st.markdown("---")
 st.markdown("""
@@ -0,0 +1,60 @@
+"""Production serving for the advice API.
+
+    gunicorn -c gunicorn.conf.py api:app
+
+The app is imported once in the master (preload_app) so the Bedrock client,
+the knowledge-base index and the caches are built before workers fork;
+workers start with them already in memory. Each worker serves requests from
+a thread pool, which suits Bedrock calls that mostly wait on the network.
+On SIGTERM workers stop accepting connections and get `graceful_timeout`
+seconds to finish in-flight requests, including open SSE streams.
+
+Caches, rate limits, admission and the Bedrock concurrency limiter are per
+worker, as are the numbers on /metrics: a scrape of the shared port sees
+only the worker that happened to take it. Set API_WORKER_METRICS_PORT and
+each worker also serves its own /metrics on one of API_WORKER_METRICS_PORT
+.. API_WORKER_METRICS_PORT + workers - 1; scrape all of them.
+"""
+import multiprocessing
+import os
+import random
+
+bind = os.environ.get('API_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('API_WORKERS', str(multiprocessing.cpu_count())))
+worker_class = 'gthread'
+# Admission waits happen on request threads, so there must be a thread for every active and queued
+# request plus some for unadmitted routes (/metrics, /healthz, stats). With fewer, excess requests
+# wait in gunicorn's accept backlog instead, unprioritised and without a fast 429.
+threads = int(os.environ.get('API_THREADS', str(
+    int(os.environ.get('ADMISSION_MAX_ACTIVE', '32')) + int(os.environ.get('ADMISSION_MAX_QUEUE', '64')) + 8)))
+preload_app = True
+# Streams can legitimately stay open this long; a worker silent for longer is restarted
+timeout = int(os.environ.get('API_WORKER_TIMEOUT', '120'))
+graceful_timeout = int(os.environ.get('API_GRACEFUL_TIMEOUT', '35'))
+keepalive = int(os.environ.get('API_KEEPALIVE', '5'))
+max_requests = int(os.environ.get('API_MAX_REQUESTS', '0'))
+max_requests_jitter = int(os.environ.get('API_MAX_REQUESTS_JITTER', '0'))
+accesslog = os.environ.get('API_ACCESS_LOG', '-')
+errorlog = '-'
+worker_metrics_port = int(os.environ.get('API_WORKER_METRICS_PORT', '0'))
+
+
+def on_starting(server):
+    # Runs in the master after the preloaded app is imported, before any fork
+    import api
+    api.prepare_for_fork()
+
+
+def post_fork(server, worker):
+    # Forked workers inherit the master's random state; reseed so retry jitter differs per worker
+    random.seed()
+    if worker_metrics_port:
+        import metrics
+        port = metrics.start_server(range(worker_metrics_port, worker_metrics_port + workers))
+        if port is None:
+            print(f"Worker {worker.pid}: no free metrics port from {worker_metrics_port}")
+
+
+def worker_exit(server, worker):
+    import api
+    api.drain()
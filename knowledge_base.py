@@ -0,0 +1,380 @@
+"""In-process retrieval over the benefits plan documents in plan_docs/.
+
+Passages are scored with BM25 plus cosine similarity of dense vectors kept
+in a memory-mapped NumPy matrix. The index lives on disk next to a manifest
+of document hashes, so refresh() only re-embeds documents that changed.
+
+Each build is written to its own version directory (vectors.npy and
+manifest.json together), then published by atomically replacing the
+CURRENT pointer. Refreshes take a file lock, so preforked workers sharing
+one index directory never see or write a half-built index. In memory, the
+loaded index and FAQ are immutable snapshots replaced by a single
+assignment, so searches running during a refresh see either the old
+snapshot or the new one, never a mix of both.
+"""
+import contextlib
+import hashlib
+import json
+import math
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import zlib
+from collections import Counter, namedtuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: only one process should refresh the index at a time
+    fcntl = None
+
+import numpy as np
+
+import metrics
+
+PLAN_DOCS_DIR = os.environ.get('PLAN_DOCS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'plan_docs'))
+KB_INDEX_DIR = os.environ.get('KB_INDEX_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.kb_index'))
+FAQ_FILE = 'faq.json'
+INDEX_POINTER = 'CURRENT'
+INDEX_LOCK = '.lock'
+
+EMBEDDING_DIM = 512
+BM25_K1 = 1.5
+BM25_B = 0.75
+# Weight of BM25 vs dense similarity in the hybrid score
+HYBRID_ALPHA = 0.5
+# A FAQ answer is given directly only above this similarity, and only when every content
+# word of the question appears in the FAQ question; related entries go to the model instead
+FAQ_DIRECT_THRESHOLD = float(os.environ.get('KB_FAQ_DIRECT_THRESHOLD', '0.75'))
+MAX_PASSAGE_WORDS = 120
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'can', 'do', 'does', 'for', 'from', 'how', 'i',
+    'if', 'in', 'is', 'it', 'my', 'of', 'on', 'or', 'the', 'to', 'what', 'when', 'which', 'with', 'you',
+    'your', 'me', 'should', 'there', 'this', 'that', 'between',
+}
+
+
+def tokenize(text):
+    return [t for t in _TOKEN_RE.findall(text.lower()) if len(t) > 1 and t not in STOPWORDS]
+
+
+def embed(texts, dim=EMBEDDING_DIM, bigrams=True):
+    """Feature-hashed unigram (+ bigram) vectors, L2-normalized.
+
+    Deterministic and dependency-free, so the index can be built anywhere;
+    rows are comparable with a plain dot product.
+    """
+    matrix = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        tokens = tokenize(text)
+        if bigrams:
+            tokens = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+        features = Counter(tokens)
+        for feature, count in features.items():
+            h = zlib.crc32(feature.encode('utf-8'))
+            sign = 1.0 if h & 0x80000000 else -1.0
+            matrix[row, h % dim] += sign * (1.0 + math.log(count))
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix
+
+
+def split_passages(text, max_words=MAX_PASSAGE_WORDS):
+    """Split a markdown document into paragraph-sized passages, each prefixed with its heading"""
+    passages = []
+    heading = ''
+    for block in re.split(r"\n\s*\n", text):
+        block = block.strip()
+        if not block:
+            continue
+        if block.startswith('#'):
+            lines = block.splitlines()
+            heading = lines[0].lstrip('#').strip()
+            block = '\n'.join(lines[1:]).strip()
+            if not block:
+                continue
+        words = block.split()
+        for start in range(0, len(words), max_words):
+            body = ' '.join(words[start:start + max_words])
+            passages.append(f"{heading}: {body}" if heading else body)
+    return passages
+
+
+def _file_hash(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+class BM25:
+    def __init__(self, documents, k1=BM25_K1, b=BM25_B):
+        self.k1 = k1
+        self.b = b
+        self.size = len(documents)
+        lengths = np.array([len(doc) for doc in documents], dtype=np.float32)
+        self.avg_length = float(lengths.mean()) if self.size else 0.0
+        self._length_norm = k1 * (1 - b + b * lengths / (self.avg_length or 1.0))
+        postings = {}
+        for doc_id, doc in enumerate(documents):
+            for term, tf in Counter(doc).items():
+                postings.setdefault(term, ([], []))
+                postings[term][0].append(doc_id)
+                postings[term][1].append(tf)
+        self._postings = {
+            term: (np.array(ids, dtype=np.int32), np.array(tfs, dtype=np.float32))
+            for term, (ids, tfs) in postings.items()
+        }
+
+    def scores(self, query_tokens):
+        scores = np.zeros(self.size, dtype=np.float32)
+        for term in set(query_tokens):
+            if term not in self._postings:
+                continue
+            ids, tfs = self._postings[term]
+            idf = math.log(1 + (self.size - len(ids) + 0.5) / (len(ids) + 0.5))
+            scores[ids] += idf * tfs * (self.k1 + 1) / (tfs + self._length_norm[ids])
+        return scores
+
+
+def _plan_context_text(sources, passages):
+    sections = []
+    for source, passage in zip(sources, passages):
+        if not sections or sections[-1][0] != source:
+            sections.append((source, []))
+        sections[-1][1].append(passage)
+    return '\n\n'.join(f"[{source}]\n" + '\n'.join(passages) for source, passages in sections)
+
+
+Index = namedtuple('Index', ['passages', 'sources', 'vectors', 'bm25', 'plan_context'])
+FAQ = namedtuple('FAQ', ['entries', 'vectors', 'terms'])
+
+
+class KnowledgeBase:
+    def __init__(self, docs_dir=PLAN_DOCS_DIR, index_dir=KB_INDEX_DIR):
+        self.docs_dir = docs_dir
+        self.index_dir = index_dir
+        # Each replaced whole by one assignment; readers take a single reference
+        self.index = Index([], [], np.zeros((0, EMBEDDING_DIM), dtype=np.float32), BM25([]), '')
+        self.faq = FAQ([], np.zeros((0, EMBEDDING_DIM), dtype=np.float32), [])
+        self._lock = threading.Lock()
+
+    def _document_paths(self):
+        if not os.path.isdir(self.docs_dir):
+            return []
+        return sorted(name for name in os.listdir(self.docs_dir) if name.endswith(('.md', '.txt')))
+
+    @contextlib.contextmanager
+    def _index_lock(self):
+        """Exclusive across processes; version directories are only created or removed under it"""
+        os.makedirs(self.index_dir, exist_ok=True)
+        with open(os.path.join(self.index_dir, INDEX_LOCK), 'a') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _current_version(self):
+        try:
+            with open(os.path.join(self.index_dir, INDEX_POINTER)) as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def _load_manifest(self):
+        version = self._current_version()
+        if version is None:
+            return {'documents': {}}, None
+        try:
+            with open(os.path.join(self.index_dir, version, 'manifest.json')) as f:
+                manifest = json.load(f)
+            vectors = np.load(os.path.join(self.index_dir, version, 'vectors.npy'), mmap_mode='r')
+        except (OSError, ValueError):
+            return {'documents': {}}, None
+        if vectors.shape[1] != EMBEDDING_DIM:
+            return {'documents': {}}, None
+        return manifest, vectors
+
+    def refresh(self):
+        """Bring the on-disk index up to date with plan_docs/; returns the number of re-embedded documents"""
+        with self._lock, self._index_lock():
+            manifest, old_vectors = self._load_manifest()
+            old_docs = manifest['documents']
+
+            documents = {}
+            blocks = []
+            changed = 0
+            for name in self._document_paths():
+                path = os.path.join(self.docs_dir, name)
+                digest = _file_hash(path)
+                old = old_docs.get(name)
+                if old and old['hash'] == digest and old_vectors is not None:
+                    blocks.append(np.asarray(old_vectors[old['start']:old['end']]))
+                    passages = old['passages']
+                else:
+                    with open(path, encoding='utf-8') as f:
+                        passages = split_passages(f.read())
+                    blocks.append(embed(passages))
+                    changed += 1
+                documents[name] = {'hash': digest, 'passages': passages}
+
+            removed = set(old_docs) - set(documents)
+            if changed or removed or old_vectors is None:
+                self._write_index(documents, blocks)
+                self._load_index()
+            elif not self.index.passages:
+                self._load_index()
+            self._load_faq()
+            return changed
+
+    def _write_index(self, documents, blocks):
+        """Build a new version directory and point CURRENT at it; the caller holds _index_lock"""
+        version_dir = tempfile.mkdtemp(prefix='v-', dir=self.index_dir)
+        try:
+            total = sum(len(block) for block in blocks)
+            matrix = np.lib.format.open_memmap(os.path.join(version_dir, 'vectors.npy'), mode='w+',
+                                               dtype=np.float32, shape=(total, EMBEDDING_DIM))
+            row = 0
+            for (name, doc), block in zip(documents.items(), blocks):
+                matrix[row:row + len(block)] = block
+                doc['start'], doc['end'] = row, row + len(block)
+                row += len(block)
+            matrix.flush()
+            del matrix
+            with open(os.path.join(version_dir, 'manifest.json'), 'w') as f:
+                json.dump({'documents': documents}, f)
+
+            fd, tmp_pointer = tempfile.mkstemp(prefix='.current-', dir=self.index_dir)
+            with os.fdopen(fd, 'w') as f:
+                f.write(os.path.basename(version_dir))
+            os.replace(tmp_pointer, os.path.join(self.index_dir, INDEX_POINTER))
+        except BaseException:
+            shutil.rmtree(version_dir, ignore_errors=True)
+            raise
+        self._remove_stale(os.path.basename(version_dir))
+
+    def _remove_stale(self, keep):
+        """Delete old versions, pre-versioning files and leftovers from crashed writers.
+
+        Safe under _index_lock: every reader of the index also holds it, and
+        vectors already memory-mapped stay readable after their file is unlinked.
+        """
+        for name in os.listdir(self.index_dir):
+            if name in (keep, INDEX_POINTER, INDEX_LOCK):
+                continue
+            path = os.path.join(self.index_dir, name)
+            try:
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                else:
+                    os.remove(path)
+            except OSError as e:
+                print(f"Could not remove stale index file {path}: {e}")
+
+    def _load_index(self):
+        manifest, vectors = self._load_manifest()
+        passages, sources = [], []
+        for name, doc in manifest['documents'].items():
+            passages.extend(doc['passages'])
+            sources.extend([name] * len(doc['passages']))
+        if vectors is None:
+            vectors = np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+        self.index = Index(passages, sources, vectors, BM25([tokenize(p) for p in passages]),
+                           _plan_context_text(sources, passages))
+
+    def _load_faq(self):
+        path = os.path.join(self.docs_dir, FAQ_FILE)
+        try:
+            with open(path, encoding='utf-8') as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            entries = []
+        questions = [entry['question'] for entry in entries]
+        # Unigrams only: paraphrased questions rarely share word order
+        self.faq = FAQ(entries, embed(questions, bigrams=False), [set(tokenize(q)) for q in questions])
+
+    def search(self, question, k=3):
+        """Return up to k (score, source, passage) tuples, best first"""
+        index = self.index
+        if not index.passages:
+            return []
+        bm25 = index.bm25.scores(tokenize(question))
+        if bm25.max() > 0:
+            bm25 /= bm25.max()
+        dense = index.vectors @ embed([question])[0]
+        scores = HYBRID_ALPHA * bm25 + (1 - HYBRID_ALPHA) * dense
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), index.sources[i], index.passages[i]) for i in top if scores[i] > 0]
+
+    def plan_context(self):
+        """Every passage, in index order, as one block for a cacheable prompt prefix.
+
+        Byte-identical until plan_docs/ changes, so Bedrock can reuse it across calls.
+        """
+        return self.index.plan_context
+
+    def match_faq(self, question):
+        """Return (similarity, entry, covered) for the closest FAQ question, or (0.0, None, False).
+
+        covered is True when every content word of the question appears in the
+        FAQ question, i.e. the FAQ asks the same thing rather than something near it.
+        """
+        faq = self.faq
+        if not faq.entries:
+            return 0.0, None, False
+        similarities = faq.vectors @ embed([question], bigrams=False)[0]
+        best = int(np.argmax(similarities))
+        covered = set(tokenize(question)) <= faq.terms[best]
+        return float(similarities[best]), faq.entries[best], covered
+
+
+_knowledge_base = None
+_kb_lock = threading.Lock()
+_last_refresh = 0.0
+KB_REFRESH_INTERVAL = float(os.environ.get('KB_REFRESH_INTERVAL', '60'))
+
+
+def get_knowledge_base():
+    """Process-wide index, re-checked against plan_docs/ at most every KB_REFRESH_INTERVAL seconds"""
+    global _knowledge_base, _last_refresh
+    with _kb_lock:
+        if _knowledge_base is None:
+            _knowledge_base = KnowledgeBase()
+        if time.monotonic() - _last_refresh >= KB_REFRESH_INTERVAL:
+            try:
+                _knowledge_base.refresh()
+            except Exception as e:
+                print(f"Knowledge base refresh failed: {e}")
+            _last_refresh = time.monotonic()
+        return _knowledge_base
+
+
+def ground_question(question, k=3):
+    """Answer from the FAQ when it asks the same thing, otherwise wrap the question in retrieved context.
+
+    A FAQ entry that is close but not the same question is passed to the
+    model as context rather than answered directly.
+
+    Returns (direct_answer, prompt): exactly one of them is not None.
+    """
+    with metrics.stage_seconds.time(stage='retrieval'):
+        kb = get_knowledge_base()
+        similarity, entry, covered = kb.match_faq(question)
+        related = entry is not None and similarity >= FAQ_DIRECT_THRESHOLD
+        if related and covered:
+            return entry['answer'], None
+        hits = kb.search(question, k=k)
+    context = [f"- {passage}" for _, _, passage in hits]
+    if related:
+        context.insert(0, f"- FAQ: {entry['question']} {entry['answer']}")
+    if not context:
+        return None, question
+    context = '\n'.join(context)
+    return None, f"Use this plan information where relevant:\n{context}\n\nQuestion: {question}"
@@ -0,0 +1,291 @@
+"""Process-wide counters, gauges and histograms, rendered in Prometheus text format.
+
+Every metric lives in REGISTRY. api.py serves it on /metrics; the
+Streamlit apps show summary() in the sidebar. Under a preforking server
+each worker can also serve its own registry on a port of its own
+(start_server), so every worker is scraped rather than whichever one a
+request happens to reach.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def values(self):
+        with self._lock:
+            return dict(self._values)
+
+    def render(self):
+        lines = self._header()
+        for key, value in sorted(self.values().items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def values(self):
+        with self._lock:
+            return dict(self._values)
+
+    def render(self):
+        lines = self._header()
+        for key, value in sorted(self.values().items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, (None, 0.0))
+            if counts is None:
+                counts = [0] * (len(self.buckets) + 1)
+            # Last slot is the +Inf bucket
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def values(self):
+        with self._lock:
+            return {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+
+    def quantile(self, q, counts):
+        """Estimate a quantile from bucket counts by linear interpolation, like histogram_quantile()"""
+        total = sum(counts)
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for i, count in enumerate(counts):
+            if seen + count >= rank and count:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    def render(self):
+        lines = self._header()
+        for key, (counts, total) in sorted(self.values().items()):
+            cumulative = 0
+            for upper, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if upper == float('inf') else repr(upper)
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', le)])} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, fn):
+        """fn() is called before every render to refresh gauges from live objects"""
+        with self._lock:
+            self._collectors.append(fn)
+
+    def collect(self):
+        with self._lock:
+            collectors = list(self._collectors)
+        for fn in collectors:
+            try:
+                fn()
+            except Exception as e:
+                print(f"Metrics collector failed: {e}")
+
+    def render(self):
+        self.collect()
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(ports, host='0.0.0.0'):
+    """Serve REGISTRY on /metrics from a daemon thread, on the first of `ports` that is free.
+
+    A replacement worker takes over the port its predecessor released, so
+    scrape targets stay fixed. Returns the port, or None if all are taken.
+    """
+    for port in ports:
+        try:
+            server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        except OSError:
+            continue
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+        return port
+    return None
+
+stage_seconds = REGISTRY.register(Histogram(
+    'benefits_advice_stage_seconds', 'Time spent per advice pipeline stage', ['stage']))
+bedrock_call_seconds = REGISTRY.register(Histogram(
+    'benefits_bedrock_call_seconds', 'Bedrock call latency including retries', ['model', 'operation']))
+bedrock_first_token_seconds = REGISTRY.register(Histogram(
+    'benefits_bedrock_first_token_seconds', 'Time to the first streamed text chunk',
+    ['model', 'prompt_cache']))
+bedrock_tokens = REGISTRY.register(Counter(
+    'benefits_bedrock_tokens_total', 'Tokens reported in Bedrock usage (input, output, cache_read, cache_write)',
+    ['model', 'direction']))
+bedrock_errors = REGISTRY.register(Counter(
+    'benefits_bedrock_errors_total', 'Bedrock calls that failed after retries', ['model']))
+cache_lookups = REGISTRY.register(Counter(
+    'benefits_advice_cache_lookups_total', 'Advice cache lookups by outcome', ['request_class', 'result']))
+fallbacks = REGISTRY.register(Counter(
+    'benefits_advice_fallbacks_total', 'Demo fallback responses served', ['reason']))
+dynamodb_call_seconds = REGISTRY.register(Histogram(
+    'benefits_dynamodb_call_seconds', 'DynamoDB call latency', ['operation']))
+dynamodb_errors = REGISTRY.register(Counter(
+    'benefits_dynamodb_errors_total', 'DynamoDB calls that raised', ['operation']))
+bedrock_concurrency = REGISTRY.register(Gauge(
+    'benefits_bedrock_concurrency', 'Adaptive limiter limit, in-flight and waiting calls', ['kind']))
+bedrock_circuit_open = REGISTRY.register(Gauge(
+    'benefits_bedrock_circuit_open', '1 while the Bedrock circuit breaker rejects calls'))
+admission_requests = REGISTRY.register(Gauge(
+    'benefits_admission_requests', 'API requests holding or waiting for an admission slot', ['kind']))
+
+
+@contextmanager
+def timed_dynamodb(operation):
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        dynamodb_errors.inc(operation=operation)
+        raise
+    finally:
+        dynamodb_call_seconds.observe(time.perf_counter() - started, operation=operation)
+
+
+def _histogram_summary(histogram):
+    rows = {}
+    for key, (counts, total) in histogram.values().items():
+        count = sum(counts)
+        rows[key] = {
+            'count': count,
+            'mean': total / count if count else None,
+            'p50': histogram.quantile(0.5, counts),
+            'p95': histogram.quantile(0.95, counts),
+        }
+    return rows
+
+
+def summary():
+    """Compact view of the main metrics for dashboards"""
+    REGISTRY.collect()
+    cache = {}
+    for (request_class, result), value in cache_lookups.values().items():
+        cache.setdefault(request_class, {})[result] = value
+    for counts in cache.values():
+        lookups = sum(counts.values())
+        counts['hit_rate'] = (lookups - counts.get('miss', 0)) / lookups if lookups else 0.0
+    tokens = {}
+    for (model, direction), value in bedrock_tokens.values().items():
+        tokens.setdefault(model, {})[direction] = value
+    return {
+        'bedrock': {
+            f"{model} ({operation})": row for (model, operation), row in _histogram_summary(bedrock_call_seconds).items()
+        },
+        'first_token': {
+            f"{model} (cache {prompt_cache})": row
+            for (model, prompt_cache), row in _histogram_summary(bedrock_first_token_seconds).items()
+        },
+        'stages': {stage: row for (stage,), row in _histogram_summary(stage_seconds).items()},
+        'tokens': tokens,
+        'cache': cache,
+        'fallbacks': {reason: value for (reason,), value in fallbacks.values().items()},
+        'dynamodb': {op: row for (op,), row in _histogram_summary(dynamodb_call_seconds).items()},
+    }
@@ -0,0 +1,75 @@
+import threading
+from collections import deque, namedtuple
+
+Route = namedtuple('Route', ['models', 'inference_config', 'hedge', 'latency_budget'])
+
+# Each request class gets an ordered fallback chain and its own token budget.
+# Every model in a chain must accept the Nova messages format.
+ROUTES = {
+    # One-off follow-up questions: short answers, fastest model first
+    'quick': Route(
+        models=('amazon.nova-micro-v1:0', 'amazon.nova-lite-v1:0'),
+        inference_config={"max_new_tokens": 500, "temperature": 0.7},
+        hedge=True,
+        latency_budget=4.0,
+    ),
+    'recommendation': Route(
+        models=('amazon.nova-micro-v1:0', 'amazon.nova-lite-v1:0'),
+        inference_config={"max_new_tokens": 1000, "temperature": 0.7},
+        hedge=True,
+        latency_budget=10.0,
+    ),
+    # Multi-benefit comparisons need more reasoning and room
+    'comparison': Route(
+        models=('amazon.nova-lite-v1:0', 'amazon.nova-micro-v1:0'),
+        inference_config={"max_new_tokens": 1200, "temperature": 0.5},
+        hedge=False,
+        latency_budget=15.0,
+    ),
+}
+DEFAULT_REQUEST_CLASS = 'quick'
+
+# Models that accept cachePoint blocks, with the shortest prefix (in tokens)
+# Bedrock will cache for them; a checkpoint on a shorter prefix is wasted
+PROMPT_CACHE_MIN_TOKENS = {
+    'amazon.nova-micro-v1:0': 1000,
+    'amazon.nova-lite-v1:0': 1000,
+    'amazon.nova-pro-v1:0': 1000,
+}
+
+
+def get_route(request_class):
+    if request_class not in ROUTES:
+        raise ValueError(f"Unknown request class: {request_class}")
+    return ROUTES[request_class]
+
+
+class LatencyTracker:
+    """Rolling window of recent call latencies per model"""
+
+    def __init__(self, window=200, min_samples=20):
+        self.window = window
+        self.min_samples = min_samples
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, model_id, seconds):
+        with self._lock:
+            self._samples.setdefault(model_id, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, model_id, pct):
+        """Return the pct-th percentile, or None until min_samples calls have been seen"""
+        with self._lock:
+            samples = sorted(self._samples.get(model_id, ()))
+        if len(samples) < self.min_samples:
+            return None
+        index = min(len(samples) - 1, int(round(pct / 100 * (len(samples) - 1))))
+        return samples[index]
+
+    def stats(self):
+        with self._lock:
+            models = list(self._samples)
+        return {
+            model_id: {'p50': self.percentile(model_id, 50), 'p95': self.percentile(model_id, 95)}
+            for model_id in models
+        }
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""Precompute recommendations for the whole UserBenefitsContext roster.
+
+Benefit rankings for every employee are scored in one batched pass, then
+employees are grouped by profile bucket. Each benefit section is requested
+as a structured fragment once per distinct (profile, benefit) pair, so
+buckets that differ only in their selected benefits share calls and stored
+fragments. Progress is checkpointed to a JSON file, so an interrupted run
+picks up where it left off when started again.
+
+Only the recommendation attributes are written, and only if the employee
+has not used the app since the scan; anyone who has keeps what they have.
+"""
+import argparse
+import datetime
+import json
+import os
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import boto3
+from botocore.exceptions import ClientError
+
+from bedrock_client import get_structured_recommendations
+from benefit_scoring import BENEFITS, rank_roster, ranking_from_item, ranking_to_item
+from metrics import timed_dynamodb
+from profile_buckets import benefit_section_question, bucket_from_item
+from recommendations import FragmentStore, fragments_to_item
+
+ALL_BENEFIT_TYPES = BENEFITS
+
+
+def scan_segment(table, segment, total_segments):
+    items = []
+    kwargs = {'Segment': segment, 'TotalSegments': total_segments}
+    while True:
+        with timed_dynamodb('Scan'):
+            response = table.scan(**kwargs)
+        items.extend(response.get('Items', []))
+        if 'LastEvaluatedKey' not in response:
+            return items
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def parallel_scan(table, total_segments):
+    with ThreadPoolExecutor(max_workers=total_segments) as pool:
+        futures = [pool.submit(scan_segment, table, segment, total_segments)
+                   for segment in range(total_segments)]
+        items = []
+        for future in futures:
+            items.extend(future.result())
+    return items
+
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return set()
+    with open(path) as f:
+        return set(json.load(f).get('completed', []))
+
+
+def save_checkpoint(path, completed):
+    # Write-then-rename so a crash never leaves a truncated checkpoint behind
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({'completed': sorted(completed)}, f)
+    os.replace(tmp_path, path)
+
+
+def is_fresh(item, max_age):
+    generated_at = item.get('recommendations_generated_at')
+    if not generated_at or not (item.get('recommendation_fragments') or item.get('recommendations')):
+        return False
+    return datetime.datetime.now() - datetime.datetime.fromisoformat(generated_at) <= max_age
+
+
+def group_by_bucket(items, completed, max_age):
+    groups = defaultdict(list)
+    for item in items:
+        if item['employee_number'] in completed or is_fresh(item, max_age):
+            continue
+        profile = item.get('profile') or {}
+        bucket = bucket_from_item(profile, profile.get('benefit_types') or ALL_BENEFIT_TYPES)
+        groups[bucket].append(item)
+    return groups
+
+
+def _unchanged_condition(item, attribute, names, values):
+    names[f'#{attribute}'] = attribute
+    if attribute not in item:
+        return f'attribute_not_exists(#{attribute})'
+    values[f':seen_{attribute}'] = item[attribute]
+    return f'#{attribute} = :seen_{attribute}'
+
+
+def write_bucket(table, items, fragment_ids):
+    """Set the bucket's fragments on each employee; return how many were skipped as changed since the scan.
+
+    Updates only the recommendation attributes (dropping the superseded
+    `recommendations` text), conditional on last_interaction and
+    recommendations_generated_at being as scanned, so nothing the app wrote
+    during the run is overwritten.
+    """
+    generated_at = datetime.datetime.now().isoformat()
+    skipped = 0
+    for item in items:
+        names = {'#fragments': 'recommendation_fragments', '#generated_at': 'recommendations_generated_at',
+                 '#ranking': 'benefit_ranking', '#text': 'recommendations'}
+        values = {':fragments': fragments_to_item(fragment_ids), ':generated_at': generated_at,
+                  ':ranking': item['benefit_ranking']}
+        condition = ' AND '.join(_unchanged_condition(item, attribute, names, values)
+                                 for attribute in ('last_interaction', 'recommendations_generated_at'))
+        try:
+            with timed_dynamodb('UpdateItem'):
+                table.update_item(
+                    Key={'employee_number': item['employee_number']},
+                    UpdateExpression='SET #fragments = :fragments, #generated_at = :generated_at, '
+                                     '#ranking = :ranking REMOVE #text',
+                    ConditionExpression=condition,
+                    ExpressionAttributeNames=names,
+                    ExpressionAttributeValues=values,
+                )
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+            skipped += 1
+    return skipped
+
+
+def precompute(table, fragment_store, segments=4, concurrency=4, checkpoint_path='precompute_checkpoint.json',
+               max_age_days=7):
+    completed = load_checkpoint(checkpoint_path)
+    max_age = datetime.timedelta(days=max_age_days)
+
+    items = parallel_scan(table, segments)
+    groups = group_by_bucket(items, completed, max_age)
+    print(f"Scanned {len(items)} employees; {sum(len(g) for g in groups.values())} need "
+          f"recommendations across {len(groups)} profile buckets")
+
+    pending = [item for group in groups.values() for item in group]
+    rankings = rank_roster([item.get('profile') or {} for item in pending])
+    for item, ranking in zip(pending, rankings):
+        item['benefit_ranking'] = ranking_to_item(ranking)
+
+    # Rankings only depend on bucketed fields, so any member's ranking stands for the bucket
+    bucket_questions = {}
+    waiting = defaultdict(list)
+    for bucket, group in groups.items():
+        questions = {benefit: benefit_section_question(bucket, benefit)
+                     for benefit, _ in ranking_from_item(group[0]['benefit_ranking']) or []}
+        bucket_questions[bucket] = questions
+        for benefit, question in questions.items():
+            waiting[(question, benefit)].append(bucket)
+
+    failed = 0
+    skipped = 0
+    results = {}
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = {pool.submit(get_structured_recommendations, question, [benefit]): (question, benefit)
+                   for question, benefit in waiting}
+        print(f"Requesting {len(futures)} distinct benefit sections")
+        for future in as_completed(futures):
+            section = futures[future]
+            results[section] = future.result()
+            for bucket in waiting[section]:
+                questions = bucket_questions[bucket]
+                if not all((question, benefit) in results for benefit, question in questions.items()):
+                    continue
+                sections = [results[(question, benefit)] for benefit, question in questions.items()]
+                if not all(sections):
+                    # Leave these out of the checkpoint so the next run retries them
+                    failed += 1
+                    continue
+                fragments = {benefit: fragment for section in sections for benefit, fragment in section.items()}
+                # Employees active since the scan are skipped, not retried: they have the app's answer
+                skipped += write_bucket(table, groups[bucket], fragment_store.save(fragments))
+                completed.update(item['employee_number'] for item in groups[bucket])
+                save_checkpoint(checkpoint_path, completed)
+
+    print(f"Done: {len(groups) - failed} buckets written, {failed} failed; "
+          f"{skipped} employees skipped as active during the run; "
+          f"{fragment_store.writes} fragments stored, {fragment_store.deduplicated} reused")
+    if failed:
+        return False
+    # A finished run starts the next one from scratch
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--region', default='us-east-1')
+    parser.add_argument('--table', default='UserBenefitsContext')
+    parser.add_argument('--fragment-table', default='RecommendationFragments')
+    parser.add_argument('--segments', type=int, default=4, help="parallel scan segments")
+    parser.add_argument('--concurrency', type=int, default=4, help="concurrent Bedrock calls")
+    parser.add_argument('--checkpoint', default='precompute_checkpoint.json')
+    parser.add_argument('--max-age-days', type=int, default=7,
+                        help="skip employees whose recommendations are newer than this")
+    parser.add_argument('--reset', action='store_true', help="ignore and overwrite the existing checkpoint")
+    args = parser.parse_args()
+
+    if args.reset and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+
+    dynamodb = boto3.resource('dynamodb', region_name=args.region)
+    ok = precompute(dynamodb.Table(args.table), FragmentStore(dynamodb.Table(args.fragment_table)),
+                    args.segments, args.concurrency,
+                    args.checkpoint, args.max_age_days)
+    raise SystemExit(0 if ok else 1)
@@ -0,0 +1,88 @@
+from collections import namedtuple
+
+# (upper bound exclusive, label); the last band catches everything above
+AGE_BANDS = [(26, '18-25'), (35, '26-34'), (45, '35-44'), (55, '45-54'), (65, '55-64'), (None, '65+')]
+INCOME_BANDS = [
+    (30000, 'under $30k'),
+    (50000, '$30k-$50k'),
+    (75000, '$50k-$75k'),
+    (100000, '$75k-$100k'),
+    (150000, '$100k-$150k'),
+    (None, '$150k+'),
+]
+MAX_DEPENDENTS_BUCKET = 3
+
+ProfileBucket = namedtuple('ProfileBucket', [
+    'age_band', 'income_band', 'family_status', 'dependents',
+    'health_concerns', 'financial_goals', 'benefit_types',
+])
+
+
+def _band(value, bands):
+    for upper, label in bands:
+        if upper is None or value < upper:
+            return label
+
+
+def canonicalize_profile(age, income, family_status, dependents, health_concerns=(),
+                         financial_goals='', benefit_types=()):
+    """Map the raw form fields onto a coarse, hashable profile bucket"""
+    dependents = int(dependents)
+    return ProfileBucket(
+        age_band=_band(int(age), AGE_BANDS),
+        income_band=_band(int(income), INCOME_BANDS),
+        family_status=family_status,
+        dependents=f"{MAX_DEPENDENTS_BUCKET}+" if dependents >= MAX_DEPENDENTS_BUCKET else str(dependents),
+        health_concerns=tuple(sorted(set(health_concerns or ()))),
+        financial_goals=financial_goals,
+        benefit_types=tuple(sorted(set(benefit_types or ()))),
+    )
+
+
+def bucket_from_item(profile, benefit_types=()):
+    """Build a bucket from the `profile` map stored in UserBenefitsContext"""
+    return canonicalize_profile(
+        profile.get('age', 30),
+        profile.get('income', 50000),
+        profile.get('family_status', 'Single'),
+        profile.get('dependents', 0),
+        profile.get('health_concerns', []),
+        profile.get('financial_goals', 'Save money'),
+        benefit_types or profile.get('benefit_types', []),
+    )
+
+
+def describe_bucket(bucket):
+    health = ', '.join(bucket.health_concerns) or 'none specified'
+    return (f"Age: {bucket.age_band}, Income: {bucket.income_band}, Family: {bucket.family_status}, "
+            f"Dependents: {bucket.dependents}, Health priorities: {health}, Goal: {bucket.financial_goals}")
+
+
+def recommendation_question(bucket):
+    # Built only from bucketed fields so every employee in a bucket sends the same prompt
+    return f"Recommend optimal benefits for: {describe_bucket(bucket)}. Focus on: {', '.join(bucket.benefit_types)}"
+
+
+def comparison_question(bucket):
+    return (f"Compare and contrast these benefits for someone with profile: Age {bucket.age_band}, "
+            f"Income {bucket.income_band}, Family status: {bucket.family_status}. "
+            f"Benefits to compare: {', '.join(bucket.benefit_types)}")
+
+
+def explanation_question(bucket, ranking):
+    """Ask the model to explain a ranking from benefit_scoring rather than produce its own"""
+    ranked = ', '.join(f"{i}. {benefit}" for i, (benefit, _) in enumerate(ranking, 1))
+    return (f"These benefits have been ranked for someone with profile: {describe_bucket(bucket)}. "
+            f"Ranking, best fit first: {ranked}. Keep this order and briefly explain why each benefit "
+            f"fits at its position and what to consider when enrolling.")
+
+
+def benefit_section_question(bucket, benefit):
+    """One benefit's recommendation section.
+
+    Leaves out the other selected benefits and the ranking so the prompt, and
+    its cached answer, only change when this benefit or the profile does.
+    """
+    return (f"For someone with profile: {describe_bucket(bucket)}, explain in one short section how well "
+            f"{benefit} fits their situation, which level of coverage or use suits them, and what to "
+            f"consider when enrolling. Do not discuss other benefits.")
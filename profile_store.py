@@ -0,0 +1,178 @@
+import atexit
+import copy
+import threading
+
+from metrics import timed_dynamodb
+from response_cache import ResponseCache
+
+_MISSING = object()
+
+
+class ProfileWriter:
+    """Write-behind persistence for UserBenefitsContext items.
+
+    Remembers what was last written for each employee and sends only the
+    attributes that changed, as a single UpdateItem. Saves are debounced per
+    employee: changes arriving within `debounce_seconds` of each other are
+    merged and flushed once from a background timer.
+    """
+
+    def __init__(self, table, debounce_seconds=2.0, on_write=None):
+        self.table = table
+        self.debounce_seconds = debounce_seconds
+        self.on_write = on_write
+        self._persisted = {}
+        self._pending = {}
+        self._timers = {}
+        self._errors = {}
+        self._flush_locks = {}
+        self._lock = threading.Lock()
+        self.writes = 0
+        self.coalesced = 0
+        atexit.register(self.flush_all)
+
+    def remember(self, employee_number, item):
+        """Record an item as read from DynamoDB so later saves can be diffed against it"""
+        with self._lock:
+            self._persisted[employee_number] = {
+                key: copy.deepcopy(value) for key, value in item.items() if key != 'employee_number'
+            }
+
+    def forget(self, employee_number):
+        with self._lock:
+            self._persisted.pop(employee_number, None)
+
+    def save(self, employee_number, attributes, flush=False):
+        with self._lock:
+            persisted = self._persisted.get(employee_number, {})
+            pending = self._pending.setdefault(employee_number, {})
+            for key, value in attributes.items():
+                if key == 'employee_number':
+                    continue
+                if key in pending:
+                    self.coalesced += 1
+                elif persisted.get(key, _MISSING) == value:
+                    continue
+                pending[key] = copy.deepcopy(value)
+            if not pending:
+                del self._pending[employee_number]
+                return True
+
+            timer = self._timers.pop(employee_number, None)
+            if timer is not None:
+                timer.cancel()
+            if not flush:
+                timer = threading.Timer(self.debounce_seconds, self.flush, args=(employee_number,))
+                timer.daemon = True
+                self._timers[employee_number] = timer
+                timer.start()
+                return True
+        return self.flush(employee_number)
+
+    def _flush_lock(self, employee_number):
+        with self._lock:
+            return self._flush_locks.setdefault(employee_number, threading.Lock())
+
+    def flush(self, employee_number):
+        # Serialize flushes per employee so a timer and an explicit flush cannot reorder writes
+        with self._flush_lock(employee_number):
+            with self._lock:
+                timer = self._timers.pop(employee_number, None)
+                if timer is not None:
+                    timer.cancel()
+                dirty = self._pending.pop(employee_number, None)
+            if not dirty:
+                return True
+
+            names = {}
+            values = {}
+            assignments = []
+            for i, (key, value) in enumerate(sorted(dirty.items())):
+                names[f'#a{i}'] = key
+                values[f':v{i}'] = value
+                assignments.append(f'#a{i} = :v{i}')
+            try:
+                with timed_dynamodb('UpdateItem'):
+                    self.table.update_item(
+                        Key={'employee_number': employee_number},
+                        UpdateExpression='SET ' + ', '.join(assignments),
+                        ExpressionAttributeNames=names,
+                        ExpressionAttributeValues=values,
+                    )
+            except Exception as e:
+                print(f"Error saving profile {employee_number}: {e}")
+                with self._lock:
+                    # Keep the changes for the next flush, under anything saved since
+                    pending = self._pending.setdefault(employee_number, {})
+                    for key, value in dirty.items():
+                        pending.setdefault(key, value)
+                    self._errors[employee_number] = e
+                return False
+
+            with self._lock:
+                self._persisted.setdefault(employee_number, {}).update(dirty)
+                self.writes += 1
+            if self.on_write is not None:
+                self.on_write(employee_number)
+            return True
+
+    def flush_all(self):
+        with self._lock:
+            employee_numbers = list(self._pending)
+        return all([self.flush(employee_number) for employee_number in employee_numbers])
+
+    def has_pending(self, employee_number):
+        with self._lock:
+            return employee_number in self._pending
+
+    def take_error(self, employee_number):
+        """Return (and clear) the last background write error for an employee"""
+        with self._lock:
+            return self._errors.pop(employee_number, None)
+
+
+class ProfileStore:
+    """Read-through, TTL-bounded cache of UserBenefitsContext items.
+
+    Owns the ProfileWriter for the same table; every successful write drops
+    the cached copy so the next read sees it.
+    """
+
+    def __init__(self, table, ttl_seconds=300, max_entries=1024, debounce_seconds=2.0):
+        self.table = table
+        self.cache = ResponseCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self.writer = ProfileWriter(table, debounce_seconds=debounce_seconds, on_write=self.invalidate)
+        self._ready = False
+        self._lock = threading.Lock()
+        self.reads = 0
+
+    def ensure_ready(self):
+        """DescribeTable once per process; a failure is not cached so it is retried"""
+        if self._ready:
+            return
+        with self._lock:
+            if not self._ready:
+                with timed_dynamodb('DescribeTable'):
+                    self.table.load()
+                self._ready = True
+
+    def get(self, employee_number):
+        """Return the stored item, or None if the employee has no profile yet"""
+        if self.writer.has_pending(employee_number):
+            # Read our own writes: push them out (which drops the cached copy) first
+            self.writer.flush(employee_number)
+        item = self.cache.get(employee_number)
+        if item is None:
+            self.ensure_ready()
+            with timed_dynamodb('GetItem'):
+                response = self.table.get_item(Key={'employee_number': employee_number})
+            self.reads += 1
+            # Cache misses too ({}), so repeated loads for a new employee stay free
+            item = response.get('Item', {})
+            if item:
+                self.writer.remember(employee_number, item)
+            self.cache.set(employee_number, item)
+        return item or None
+
+    def invalidate(self, employee_number):
+        self.cache.invalidate(employee_number)
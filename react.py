@@ -169,7 +169,7 @@ if get_recommendations:
         question = f"Recommend optimal benefits for: {user_profile}. Focus on: {', '.join(benefit_types)}"
         
         with st.spinner("🔍 Analyzing your profile and generating recommendations..."):
-            st.session_state.recommendations = get_financial_advice(question)
+            st.session_state.recommendations = get_financial_advice(question, request_class='recommendation')
     else:
         st.warning("⚠️ Please select at least one benefit type to get recommendations.")
 
@@ -182,7 +182,7 @@ if compare_benefits:
         comparison_question = f"Compare and contrast these benefits for someone with profile: Age {age}, Income ${income}, Family status: {family_status}. Benefits to compare: {', '.join(benefit_types)}"
         
         with st.spinner("⚖️ Comparing your selected benefits..."):
-            st.session_state.comparison = get_financial_advice(comparison_question)
+            st.session_state.comparison = get_financial_advice(comparison_question, request_class='comparison')
     else:
         st.warning("⚠️ Please select at least 2 benefit types to compare.")
 
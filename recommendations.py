@@ -0,0 +1,176 @@
+"""Structured recommendations: one validated fragment per benefit.
+
+The model is asked for JSON with a tier, rationale and cost notes for each
+benefit. Fragments are stored once each in the RecommendationFragments
+table, keyed by a hash of their content. Employee items in
+UserBenefitsContext keep only the list of fragment ids
+(`recommendation_fragments`), so employees who got the same answer for a
+benefit share one stored fragment.
+"""
+import hashlib
+import json
+import re
+import threading
+
+from botocore.exceptions import ClientError
+
+from metrics import timed_dynamodb
+from response_cache import ResponseCache
+
+TIERS = ('essential', 'recommended', 'consider', 'optional')
+TIER_LABELS = {
+    'essential': '🟢 Essential',
+    'recommended': '🔵 Recommended',
+    'consider': '🟡 Worth considering',
+    'optional': '⚪ Optional',
+}
+MAX_RATIONALE_CHARS = 1200
+MAX_COST_NOTES_CHARS = 600
+
+_FENCE = re.compile(r'^```(?:json)?\s*|\s*```$')
+
+
+class RecommendationFormatError(ValueError):
+    """The model's answer did not match the recommendation schema"""
+
+
+def structured_question(question, benefits):
+    """Append the output schema to a recommendation prompt"""
+    example = {'benefits': [{'benefit': benefits[0], 'tier': 'recommended', 'rationale': '...',
+                             'cost_notes': '...'}]}
+    return (f"{question} Respond with only a JSON object, no other text, shaped like {json.dumps(example)}. "
+            f"Include exactly one entry for each of: {', '.join(benefits)}, in that order. "
+            f"'tier' must be one of: {', '.join(TIERS)}. 'rationale' is two or three sentences on why the "
+            f"benefit fits at that tier; 'cost_notes' is one or two sentences on costs and what to watch for.")
+
+
+def _text_field(entry, name, limit):
+    value = entry.get(name)
+    if not isinstance(value, str) or not value.strip():
+        raise RecommendationFormatError(f"'{name}' must be a non-empty string")
+    return ' '.join(value.split())[:limit]
+
+
+def parse_fragments(text, benefits):
+    """Validate an answer against the schema; return {benefit: fragment} in `benefits` order"""
+    body = _FENCE.sub('', text.strip())
+    start, end = body.find('{'), body.rfind('}')
+    if start < 0 or end < start:
+        raise RecommendationFormatError("No JSON object in the answer")
+    try:
+        data = json.loads(body[start:end + 1])
+    except ValueError as e:
+        raise RecommendationFormatError(f"Invalid JSON: {e}") from None
+    entries = data.get('benefits') if isinstance(data, dict) else None
+    if not isinstance(entries, list):
+        raise RecommendationFormatError("'benefits' must be a list")
+
+    wanted = {benefit.casefold(): benefit for benefit in benefits}
+    fragments = {}
+    for entry in entries:
+        if not isinstance(entry, dict):
+            raise RecommendationFormatError("Each entry must be an object")
+        benefit = wanted.get(str(entry.get('benefit', '')).strip().casefold())
+        if benefit is None:
+            raise RecommendationFormatError(f"Unexpected benefit: {entry.get('benefit')!r}")
+        tier = str(entry.get('tier', '')).strip().lower()
+        if tier not in TIERS:
+            raise RecommendationFormatError(f"Unknown tier for {benefit}: {entry.get('tier')!r}")
+        fragments[benefit] = {
+            'tier': tier,
+            'rationale': _text_field(entry, 'rationale', MAX_RATIONALE_CHARS),
+            'cost_notes': _text_field(entry, 'cost_notes', MAX_COST_NOTES_CHARS),
+        }
+    missing = [benefit for benefit in benefits if benefit not in fragments]
+    if missing:
+        raise RecommendationFormatError(f"Missing benefits: {', '.join(missing)}")
+    return {benefit: fragments[benefit] for benefit in benefits}
+
+
+def fragment_id(benefit, fragment):
+    raw = json.dumps([benefit, fragment['tier'], fragment['rationale'], fragment['cost_notes']])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:32]
+
+
+def fragments_to_item(ids):
+    """Store {benefit: fragment_id} in an employee item as a list of maps, keeping order"""
+    return [{'benefit': benefit, 'fragment_id': fid} for benefit, fid in ids.items()]
+
+
+def fragments_from_item(stored):
+    return {entry['benefit']: entry['fragment_id'] for entry in stored or []}
+
+
+class FragmentStore:
+    """Content-addressed store for recommendation fragments.
+
+    Fragments never change once written, so reads are cached for a long
+    time and a fragment already known to exist is never written again.
+    """
+
+    def __init__(self, table, ttl_seconds=86400, max_entries=4096):
+        self.table = table
+        self.cache = ResponseCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self._lock = threading.Lock()
+        self.writes = 0
+        self.deduplicated = 0
+
+    def save(self, fragments):
+        """Store each fragment unless an identical one exists; return {benefit: fragment_id}"""
+        ids = {}
+        for benefit, fragment in fragments.items():
+            fid = fragment_id(benefit, fragment)
+            ids[benefit] = fid
+            if self.cache.get(fid) is not None:
+                with self._lock:
+                    self.deduplicated += 1
+                continue
+            try:
+                with timed_dynamodb('PutItem'):
+                    self.table.put_item(
+                        Item=dict(fragment, fragment_id=fid, benefit=benefit),
+                        ConditionExpression='attribute_not_exists(fragment_id)',
+                    )
+                with self._lock:
+                    self.writes += 1
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    raise
+                with self._lock:
+                    self.deduplicated += 1
+            self.cache.set(fid, dict(fragment))
+        return ids
+
+    def load(self, ids):
+        """Fetch fragments by id; return {benefit: fragment}, skipping any that are gone"""
+        fragments = {}
+        for benefit, fid in ids.items():
+            fragment = self.cache.get(fid)
+            if fragment is None:
+                with timed_dynamodb('GetItem'):
+                    item = self.table.get_item(Key={'fragment_id': fid}).get('Item')
+                if not item:
+                    continue
+                fragment = {key: item[key] for key in ('tier', 'rationale', 'cost_notes')}
+                self.cache.set(fid, fragment)
+            fragments[benefit] = fragment
+        return fragments
+
+    def stats(self):
+        with self._lock:
+            return {'writes': self.writes, 'deduplicated': self.deduplicated, 'cache': self.cache.stats()}
+
+
+def fragment_markdown(benefit, fragment, position=None, score=None):
+    heading = f"{position}. {benefit}" if position else benefit
+    if score is not None:
+        heading += f" — fit score {score}/100"
+    return (f"#### {heading}\n\n**{TIER_LABELS[fragment['tier']]}**\n\n{fragment['rationale']}\n\n"
+            f"*Cost notes:* {fragment['cost_notes']}")
+
+
+def assemble_markdown(ranking, fragments):
+    """One markdown document in ranking order, e.g. for exports and older clients"""
+    sections = [fragment_markdown(benefit, fragments[benefit], position, score)
+                for position, (benefit, score) in enumerate(ranking, 1) if benefit in fragments]
+    return '\n\n'.join(sections)
@@ -0,0 +1,168 @@
+"""Opt-in per-request profiling for the Flask API.
+
+A request is profiled when it is sampled (PROFILE_SAMPLE_RATE) or, if
+PROFILE_ALLOW_HEADER is set, when it carries the PROFILE_HEADER header.
+Each profiled request writes two files to PROFILE_DIR:
+
+- <id>.pstats: cProfile output for the request thread (load with pstats
+  or snakeviz)
+- <id>.collapsed: wall-clock stack samples of the same thread, one
+  "frame;frame;frame count" line per stack, for flamegraph.pl or speedscope
+
+Only the newest PROFILE_MAX_REQUESTS profiles are kept. Only one request is
+profiled at a time, so concurrent requests never pay for profiling. With
+both triggers off, profiled() returns the view unchanged.
+"""
+import cProfile
+import datetime
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from functools import wraps
+
+from flask import make_response, request
+
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles'))
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_ALLOW_HEADER = os.environ.get('PROFILE_ALLOW_HEADER', 'false').lower() == 'true'
+PROFILE_HEADER = os.environ.get('PROFILE_HEADER', 'X-Profile-Request')
+PROFILE_MAX_REQUESTS = int(os.environ.get('PROFILE_MAX_REQUESTS', '50'))
+PROFILE_SAMPLE_INTERVAL = float(os.environ.get('PROFILE_SAMPLE_INTERVAL', '0.005'))
+# 'wall' includes time blocked on Bedrock and DynamoDB; 'cpu' shows only work done in-process
+PROFILE_CLOCK = os.environ.get('PROFILE_CLOCK', 'wall')
+
+PROFILING_ENABLED = PROFILE_SAMPLE_RATE > 0 or PROFILE_ALLOW_HEADER
+
+_active = threading.Lock()
+_rotate_lock = threading.Lock()
+_sequence = itertools.count()
+
+
+class StackSampler(threading.Thread):
+    """Samples one thread's Python stack every `interval` seconds"""
+
+    def __init__(self, thread_id, interval=PROFILE_SAMPLE_INTERVAL):
+        super().__init__(name='request-profiler-sampler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if frames:
+                self.stacks[';'.join(reversed(frames))] += 1
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+class RequestProfile:
+    def __init__(self, name):
+        timer = time.process_time if PROFILE_CLOCK == 'cpu' else time.perf_counter
+        self.profile_id = f"{datetime.datetime.now():%Y%m%dT%H%M%S}-{os.getpid()}-{next(_sequence)}-{name}"
+        self.profiler = cProfile.Profile(timer)
+        self.sampler = StackSampler(threading.get_ident())
+
+    def start(self):
+        self.sampler.start()
+        self.profiler.enable()
+
+    def pause(self):
+        self.profiler.disable()
+
+    def resume(self):
+        self.profiler.enable()
+
+    def finish(self):
+        self.profiler.disable()
+        self.sampler.stop()
+        try:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            base = os.path.join(PROFILE_DIR, self.profile_id)
+            self.profiler.dump_stats(f"{base}.pstats")
+            with open(f"{base}.collapsed", 'w') as f:
+                for stack, count in self.sampler.stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            rotate()
+        except OSError as e:
+            print(f"Error writing request profile: {e}")
+
+
+def rotate(directory=PROFILE_DIR, keep=PROFILE_MAX_REQUESTS):
+    """Delete all but the newest `keep` profiles"""
+    with _rotate_lock:
+        names = [name for name in os.listdir(directory) if name.endswith('.pstats')]
+        names.sort(key=lambda name: os.path.getmtime(os.path.join(directory, name)))
+        for name in names[:max(0, len(names) - keep)]:
+            base = os.path.join(directory, name[:-len('.pstats')])
+            for suffix in ('.pstats', '.collapsed'):
+                try:
+                    os.remove(base + suffix)
+                except FileNotFoundError:
+                    pass
+
+
+def _wanted():
+    if PROFILE_ALLOW_HEADER and request.headers.get(PROFILE_HEADER):
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def _profiled_chunks(chunks, profile):
+    # Streamed bodies are produced after the view returns; profile each chunk as it is pulled
+    iterator = iter(chunks)
+    while True:
+        profile.resume()
+        try:
+            chunk = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            profile.pause()
+        yield chunk
+
+
+def profiled(view):
+    """Profile the wrapped view, including a streamed body, when the request is selected"""
+    if not PROFILING_ENABLED:
+        return view
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not _wanted() or not _active.acquire(blocking=False):
+            return view(*args, **kwargs)
+        profile = RequestProfile(request.endpoint or 'request')
+
+        def finish():
+            try:
+                profile.finish()
+            finally:
+                _active.release()
+
+        profile.start()
+        try:
+            response = make_response(view(*args, **kwargs))
+        except Exception:
+            finish()
+            raise
+        profile.pause()
+        response.headers['X-Profile-Id'] = profile.profile_id
+        if response.is_streamed:
+            response.response = _profiled_chunks(response.response, profile)
+            response.call_on_close(finish)
+        else:
+            finish()
+        return response
+    return wrapper
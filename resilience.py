@@ -0,0 +1,323 @@
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+
+from botocore.exceptions import ClientError, ConnectionError as BotoConnectionError, ReadTimeoutError
+
+THROTTLING_ERROR_CODES = {'ThrottlingException', 'TooManyRequestsException'}
+RETRYABLE_ERROR_CODES = THROTTLING_ERROR_CODES | {
+    'ServiceUnavailableException',
+    'InternalServerException',
+    'ModelNotReadyException',
+    'ModelTimeoutException',
+}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling Bedrock while the circuit breaker is open"""
+
+
+class LimiterTimeout(Exception):
+    """Raised when a caller waits too long for a concurrency slot"""
+
+
+def _error_code(error):
+    if isinstance(error, ClientError):
+        return error.response.get('Error', {}).get('Code')
+    return None
+
+
+def is_throttling(error):
+    return _error_code(error) in THROTTLING_ERROR_CODES
+
+
+def is_retryable(error):
+    if isinstance(error, ClientError):
+        return _error_code(error) in RETRYABLE_ERROR_CODES
+    return isinstance(error, (BotoConnectionError, ReadTimeoutError))
+
+
+def retry_call(fn, max_attempts=3, base_delay=0.25, max_delay=4.0, deadline=20.0,
+               retryable=is_retryable, sleep=time.sleep, clock=time.monotonic):
+    """Call fn, retrying retryable errors with full-jitter exponential backoff.
+
+    Gives up early rather than start a backoff that would end past `deadline`
+    seconds from the first attempt.
+    """
+    started = clock()
+    attempt = 1
+    while True:
+        try:
+            return fn()
+        except Exception as e:
+            if attempt >= max_attempts or not retryable(e):
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1)))
+            if clock() - started + delay > deadline:
+                raise
+            sleep(delay)
+            attempt += 1
+
+
+async def retry_call_async(fn, max_attempts=3, base_delay=0.25, max_delay=4.0, deadline=20.0,
+                           retryable=is_retryable, clock=time.monotonic):
+    """retry_call for coroutine functions: backoff waits with asyncio.sleep instead of blocking a thread"""
+    started = clock()
+    attempt = 1
+    while True:
+        try:
+            return await fn()
+        except Exception as e:
+            if attempt >= max_attempts or not retryable(e):
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1)))
+            if clock() - started + delay > deadline:
+                raise
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+class CircuitBreaker:
+    """Error-rate circuit breaker over a sliding time window.
+
+    Closed: calls flow and outcomes are recorded. Once at least `min_calls`
+    outcomes in the last `window_seconds` show a failure rate of
+    `failure_threshold` or more, the breaker opens and rejects calls for
+    `cooldown_seconds`. It then lets a single trial call through (half-open)
+    and closes again only if that call succeeds. A trial that never reports
+    back (cancelled, or hung) is given up on after `trial_timeout_seconds`
+    so another call can take its place.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=0.5, min_calls=10, window_seconds=60.0, cooldown_seconds=30.0,
+                 trial_timeout_seconds=60.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.min_calls = min_calls
+        self.window_seconds = window_seconds
+        self.cooldown_seconds = cooldown_seconds
+        self.trial_timeout_seconds = trial_timeout_seconds
+        self._clock = clock
+        self._outcomes = deque()
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._trial_started = 0.0
+        self._lock = threading.Lock()
+        self.rejected = 0
+        self.times_opened = 0
+
+    def _trim(self, now):
+        while self._outcomes and self._outcomes[0][0] < now - self.window_seconds:
+            self._outcomes.popleft()
+
+    def allow(self):
+        with self._lock:
+            now = self._clock()
+            if self._state == self.OPEN and now - self._opened_at >= self.cooldown_seconds:
+                self._state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.HALF_OPEN and (
+                    not self._trial_in_flight or now - self._trial_started >= self.trial_timeout_seconds):
+                self._trial_in_flight = True
+                self._trial_started = now
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            now = self._clock()
+            if self._state == self.HALF_OPEN:
+                self._state = self.CLOSED
+                self._outcomes.clear()
+            self._outcomes.append((now, True))
+            self._trim(now)
+
+    def record_failure(self):
+        with self._lock:
+            now = self._clock()
+            if self._state == self.HALF_OPEN:
+                self._open(now)
+                return
+            self._outcomes.append((now, False))
+            self._trim(now)
+            failures = sum(1 for _, ok in self._outcomes if not ok)
+            if (self._state == self.CLOSED and len(self._outcomes) >= self.min_calls
+                    and failures / len(self._outcomes) >= self.failure_threshold):
+                self._open(now)
+
+    def release_trial(self):
+        """Give up a call let through by allow() that ended without an outcome, e.g. was cancelled.
+
+        A half-open trial is freed so the next call can try; the breaker's
+        state and window are otherwise unchanged.
+        """
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._trial_in_flight = False
+
+    def _open(self, now):
+        self._state = self.OPEN
+        self._opened_at = now
+        self._trial_in_flight = False
+        self._outcomes.clear()
+        self.times_opened += 1
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == self.OPEN and self._clock() - self._opened_at >= self.cooldown_seconds:
+                return self.HALF_OPEN
+            return self._state
+
+    def stats(self):
+        state = self.state
+        with self._lock:
+            failures = sum(1 for _, ok in self._outcomes if not ok)
+            return {
+                'state': state,
+                'window_calls': len(self._outcomes),
+                'window_failures': failures,
+                'rejected': self.rejected,
+                'times_opened': self.times_opened,
+            }
+
+
+def _set_if_pending(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class _Slot:
+    __slots__ = ('acquired_at', 'throttled')
+
+    def __init__(self, acquired_at):
+        self.acquired_at = acquired_at
+        self.throttled = False
+
+
+class AdaptiveLimiter:
+    """AIMD concurrency limit for calls against a shared quota.
+
+    Each successful call raises the limit by `increase / limit` (about +1 per
+    full round of calls); a throttled call multiplies it by
+    `decrease_factor`. Throttles from calls that started before the last cut
+    are ignored, so one burst only cuts once. Callers over the limit queue
+    for up to `queue_timeout` seconds.
+
+    Threads and event-loop coroutines (acquire_async) share the same limit,
+    since they draw on the same quota.
+    """
+
+    def __init__(self, initial_limit=8, min_limit=1, max_limit=64, increase=1.0, decrease_factor=0.5,
+                 queue_timeout=10.0, clock=time.monotonic):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self.queue_timeout = queue_timeout
+        self._clock = clock
+        self._limit = float(initial_limit)
+        self._in_flight = 0
+        self._waiting = 0
+        self._last_cut = float('-inf')
+        self._cond = threading.Condition()
+        self._async_waiters = deque()
+        self.throttles = 0
+        self.timeouts = 0
+
+    @property
+    def limit(self):
+        return max(self.min_limit, int(self._limit))
+
+    def acquire(self, timeout=None):
+        timeout = self.queue_timeout if timeout is None else timeout
+        deadline = self._clock() + timeout
+        with self._cond:
+            self._waiting += 1
+            try:
+                while self._in_flight >= self.limit:
+                    remaining = deadline - self._clock()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise LimiterTimeout(f"No concurrency slot within {timeout:g}s")
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting -= 1
+            self._in_flight += 1
+            return _Slot(self._clock())
+
+    async def acquire_async(self, timeout=None):
+        """Like acquire(), but waits on the event loop instead of blocking the thread"""
+        timeout = self.queue_timeout if timeout is None else timeout
+        loop = asyncio.get_running_loop()
+        deadline = self._clock() + timeout
+        while True:
+            with self._cond:
+                if self._in_flight < self.limit:
+                    self._in_flight += 1
+                    return _Slot(self._clock())
+                remaining = deadline - self._clock()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise LimiterTimeout(f"No concurrency slot within {timeout:g}s")
+                waiter = loop.create_future()
+                entry = (loop, waiter)
+                self._async_waiters.append(entry)
+                self._waiting += 1
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter), remaining)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                with self._cond:
+                    self._waiting -= 1
+                    try:
+                        self._async_waiters.remove(entry)
+                    except ValueError:
+                        pass
+                    # A wake-up that arrived as we gave up goes to the next waiter
+                    if waiter.done() and self._in_flight < self.limit:
+                        self._wake_one()
+
+    def _wake_one(self):
+        # Caller holds self._cond
+        while self._async_waiters:
+            loop, waiter = self._async_waiters.popleft()
+            if not waiter.done():
+                loop.call_soon_threadsafe(_set_if_pending, waiter)
+                return
+
+    def record_throttle(self, slot):
+        with self._cond:
+            self.throttles += 1
+            slot.throttled = True
+            if slot.acquired_at >= self._last_cut:
+                self._limit = max(self.min_limit, self._limit * self.decrease_factor)
+                self._last_cut = self._clock()
+
+    def release(self, slot, success=True):
+        with self._cond:
+            self._in_flight -= 1
+            if success and not slot.throttled:
+                self._limit = min(self.max_limit, self._limit + self.increase / self._limit)
+            self._cond.notify_all()
+            self._wake_one()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'limit': self.limit,
+                'in_flight': self._in_flight,
+                'waiting': self._waiting,
+                'throttles': self.throttles,
+                'queue_timeouts': self.timeouts,
+            }
@@ -0,0 +1,206 @@
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_prompt(prompt):
+    # Case and whitespace differences should not defeat the cache
+    return ' '.join(prompt.split()).casefold()
+
+
+def make_cache_key(prompt, model_id, inference_config):
+    raw = json.dumps([normalize_prompt(prompt), model_id, inference_config], sort_keys=True)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """Thread-safe LRU cache with a per-entry TTL"""
+
+    def __init__(self, max_entries=1024, ttl_seconds=3600, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > self._clock():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value, ttl_seconds=None):
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        with self._lock:
+            self._entries[key] = (value, self._clock() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+class _InFlightCall:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Collapse concurrent calls for the same key onto one execution.
+
+    The first caller for a key (the leader) runs the work; callers arriving
+    while it is in flight block and receive the leader's result or exception.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+
+    def begin(self, key):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced += 1
+                return call, False
+            call = _InFlightCall()
+            self._calls[key] = call
+            self.leaders += 1
+            return call, True
+
+    def finish(self, key, call, result=None, error=None):
+        call.result = result
+        call.error = error
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+        call.done.set()
+
+    def wait(self, call, timeout=None):
+        if not call.done.wait(timeout):
+            raise TimeoutError("Timed out waiting for in-flight request")
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def do(self, key, fn, timeout=None):
+        call, leader = self.begin(key)
+        if not leader:
+            return self.wait(call, timeout)
+        try:
+            result = fn()
+        except BaseException as e:
+            self.finish(key, call, error=e)
+            raise
+        self.finish(key, call, result=result)
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {
+                'in_flight': len(self._calls),
+                'leaders': self.leaders,
+                'coalesced': self.coalesced,
+            }
+
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines: waiters await the leader instead of blocking a thread.
+
+    Calls are coalesced per event loop. A waiter that is cancelled does not
+    cancel the leader; a leader that is cancelled finishes with None, which
+    callers treat as "try again".
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def begin(self, key):
+        loop = asyncio.get_running_loop()
+        call = self._calls.get((loop, key))
+        if call is not None:
+            self.coalesced += 1
+            return call, False
+        call = loop.create_future()
+        self._calls[(loop, key)] = call
+        self.leaders += 1
+        return call, True
+
+    def finish(self, key, call, result=None, error=None):
+        calls_key = (call.get_loop(), key)
+        if self._calls.get(calls_key) is call:
+            del self._calls[calls_key]
+        if call.done():
+            return
+        if error is not None:
+            call.set_exception(error)
+            # Waiters re-raise it; mark it retrieved so a call nobody joined does not warn
+            call.exception()
+        else:
+            call.set_result(result)
+
+    async def wait(self, call, timeout=None):
+        try:
+            return await asyncio.wait_for(asyncio.shield(call), timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError("Timed out waiting for in-flight request") from None
+
+    async def do(self, key, fn, timeout=None):
+        """Await fn() once per key, sharing its result with concurrent callers"""
+        call, leader = self.begin(key)
+        if not leader:
+            return await self.wait(call, timeout)
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            self.finish(key, call)
+            raise
+        except Exception as e:
+            self.finish(key, call, error=e)
+            raise
+        self.finish(key, call, result=result)
+        return result
+
+    def stats(self):
+        return {
+            'in_flight': len(self._calls),
+            'leaders': self.leaders,
+            'coalesced': self.coalesced,
+        }
@@ -1,7 +1,9 @@
 import streamlit as st
 import boto3
 
-from bedrock_client import get_financial_advice
+from bedrock_client import stream_financial_advice
+from knowledge_base import ground_question
+from profile_buckets import canonicalize_profile, recommendation_question
 
 st.set_page_config(layout = 'wide')
 
@@ -34,11 +36,12 @@ if 'recommendations' not in st.session_state:
 # Generate Recommendations
 if st.button("Get Personalized Recommendations"):
     if benefit_types:
-        user_profile = f"Age: {age}, Income: ${income}, Family: {family_status}, Dependents: {dependents}, Health priorities: {health_concerns}, Goal: {financial_goals}"
-        question = f"Recommend optimal benefits for: {user_profile}. Focus on: {', '.join(benefit_types)}"
+        bucket = canonicalize_profile(age, income, family_status, dependents, health_concerns, financial_goals, benefit_types)
+        question = recommendation_question(bucket)
         
-        with st.spinner("Analyzing your profile..."):
-            st.session_state.recommendations = get_financial_advice(question)
+        st.header("Your Personalized Recommendations")
+        st.session_state.recommendations = st.write_stream(stream_financial_advice(question, request_class='recommendation'))
+        st.rerun()
     else:
         st.warning("Please select at least one benefit type.")
 
@@ -53,9 +56,11 @@ if st.session_state.recommendations:
     
     if st.button("Get Answer"):
         if user_question:
-            with st.spinner("Searching knowledge base..."):
-                answer = get_financial_advice(user_question)
+            direct_answer, prompt = ground_question(user_question)
             st.subheader("Answer")
-            st.write(answer)
+            if direct_answer:
+                st.write(direct_answer)
+            else:
+                st.write_stream(stream_financial_advice(prompt))
         else:
             st.warning("Please enter a question.")
\ No newline at end of file
@@ -3,12 +3,34 @@ import boto3
 import datetime
 from datetime import timedelta
 
-from bedrock_client import get_financial_advice
+from bedrock_client import stream_financial_advice
+from knowledge_base import ground_question
+from profile_buckets import canonicalize_profile, describe_bucket, recommendation_question
+from conversation_memory import ConversationMemory
+from metrics import timed_dynamodb
 
 # DynamoDB setup
 dynamodb = boto3.resource('dynamodb', region_name='us-east-2')
 table = dynamodb.Table('UserBenefitsContext')
 
+
+def stream_advice(question, request_class='quick'):
+    """Render the answer as it streams in, then clear it so the results section shows it.
+
+    Returns None if the stream broke part-way.
+    """
+    placeholder = st.empty()
+    try:
+        with placeholder.container():
+            text = st.write_stream(stream_financial_advice(question, request_class=request_class))
+    except Exception as e:
+        # Broke part-way; show nothing rather than an answer that stops mid-sentence
+        placeholder.empty()
+        st.error(f"The answer was cut off ({e}). Please try again.")
+        return None
+    placeholder.empty()
+    return text
+
 st.set_page_config(layout = 'wide')
 
 st.title("BenefitLink - Benefits Selection Assistant")
@@ -28,6 +50,8 @@ if 'recommendations' not in st.session_state:
     st.session_state.recommendations = None
 if 'loaded_profile' not in st.session_state:
     st.session_state.loaded_profile = {}
+if 'conversation' not in st.session_state:
+    st.session_state.conversation = ConversationMemory()
 
 # Load Profile Logic
 if st.button("Load Profile"):
@@ -37,7 +61,8 @@ if st.button("Load Profile"):
         st.error("Employee Number must be at least 5 characters.")
     else:
         try:
-            response = table.get_item(Key={'employee_number': employee_number})
+            with timed_dynamodb('GetItem'):
+                response = table.get_item(Key={'employee_number': employee_number})
             if 'Item' in response:
                 item = response['Item']
                 if item.get('name') != name:
@@ -46,6 +71,7 @@ if st.button("Load Profile"):
                 if datetime.datetime.now() - last_interaction <= timedelta(days=30):
                     st.session_state.loaded_profile = item.get('profile', {})
                     st.session_state.recommendations = item.get('recommendations', None)
+                    st.session_state.conversation = ConversationMemory.from_item(item.get('conversation'))
                     st.session_state.profile_loaded = True
                     st.success("Profile loaded successfully!")
                 else:
@@ -86,12 +112,13 @@ if name and employee_number and st.session_state.profile_loaded:
     # Generate Recommendations
     if st.button("Get Personalized Recommendations"):
         if benefit_types:
-            user_profile = f"Age: {age}, Income: ${income}, Family: {family_status}, Dependents: {dependents}, Health priorities: {health_concerns}, Goal: {financial_goals}"
-            question = f"Recommend optimal benefits for: {user_profile}. Focus on: {', '.join(benefit_types)}"
+            bucket = canonicalize_profile(age, income, family_status, dependents, health_concerns, financial_goals, benefit_types)
+            question = recommendation_question(bucket)
+            
+            recommendations = stream_advice(question, 'recommendation')
+            if recommendations is not None:
+                st.session_state.recommendations = recommendations
             
-            with st.spinner("Analyzing your profile..."):
-                st.session_state.recommendations = get_financial_advice(question)
-                
                 # Save to DynamoDB
                 profile_data = {
                     'age': age, 'income': income, 'family_status': family_status, 
@@ -103,10 +130,13 @@ if name and employee_number and st.session_state.profile_loaded:
                     'name': name,
                     'last_interaction': datetime.datetime.now().isoformat(),
                     'profile': profile_data,
-                    'recommendations': st.session_state.recommendations
+                    'recommendations': st.session_state.recommendations,
+                    'recommendations_generated_at': datetime.datetime.now().isoformat(),
+                    'conversation': st.session_state.conversation.to_item()
                 }
                 try:
-                    table.put_item(Item=item)
+                    with timed_dynamodb('PutItem'):
+                        table.put_item(Item=item)
                 except Exception as e:
                     st.error(f"Error saving profile: {e}")
         else:
@@ -123,29 +153,40 @@ if name and employee_number and st.session_state.profile_loaded:
         
         if st.button("Get Answer"):
             if user_question:
-                with st.spinner("Searching knowledge base..."):
-                    answer = get_financial_advice(user_question)
-                    
-                    # Update DynamoDB with latest interaction
-                    profile_data = {
-                        'age': age, 'income': income, 'family_status': family_status,
-                        'dependents': dependents, 'health_concerns': health_concerns,
-                        'financial_goals': financial_goals
-                    }
-                    item = {
-                        'employee_number': employee_number,
-                        'name': name,
-                        'last_interaction': datetime.datetime.now().isoformat(),
-                        'profile': profile_data,
-                        'recommendations': st.session_state.recommendations
-                    }
-                    try:
-                        table.put_item(Item=item)
-                    except Exception as e:
-                        st.error(f"Error saving profile: {e}")
-                        
+                conversation = st.session_state.conversation
+                direct_answer, prompt = ground_question(user_question)
                 st.subheader("Answer")
-                st.write(answer)
+                if direct_answer:
+                    answer = direct_answer
+                    st.write(answer)
+                else:
+                    bucket = canonicalize_profile(age, income, family_status, dependents, health_concerns, financial_goals)
+                    prompt = conversation.build_prompt(prompt, describe_bucket(bucket))
+                    answer = stream_advice(prompt)
+                    if answer is not None:
+                        st.write(answer)
+                if answer is not None:
+                    conversation.add_turn(user_question, answer)
+                
+                # Update DynamoDB with latest interaction
+                profile_data = {
+                    'age': age, 'income': income, 'family_status': family_status,
+                    'dependents': dependents, 'health_concerns': health_concerns,
+                    'financial_goals': financial_goals
+                }
+                item = {
+                    'employee_number': employee_number,
+                    'name': name,
+                    'last_interaction': datetime.datetime.now().isoformat(),
+                    'profile': profile_data,
+                    'recommendations': st.session_state.recommendations,
+                    'conversation': st.session_state.conversation.to_item()
+                }
+                try:
+                    with timed_dynamodb('PutItem'):
+                        table.put_item(Item=item)
+                except Exception as e:
+                    st.error(f"Error saving profile: {e}")
             else:
                 st.warning("Please enter a question.")
 else: